@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# coding: utf-8
+import logging
+from pathlib import Path
+
+import fire
+
+from src.phylip.batch import run_batch
+from src.phylip.configuration import parse_configuration
+
+logging.basicConfig(
+    format='%(asctime)s %(levelname)-8s %(message)s',
+    level=logging.INFO,
+    datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def main(config: str):
+    config_path = Path(config).expanduser()
+    configuration = parse_configuration(config_path)
+    configuration.validate()
+    logging.info(
+        "Reconstructing trees with %s, leaf counts: %s scales: %s genome sizes: %s alphas: %s neighborhood sizes: %s "
+        "seed: %s", configuration.constructor, configuration.leaf_counts, configuration.scales,
+        configuration.genome_sizes, configuration.alphas, configuration.neighborhood_sizes, configuration.seed)
+    run_batch(configuration)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
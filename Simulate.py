@@ -5,7 +5,7 @@ from pathlib import Path
 
 import fire
 
-from src.simulator.scenario import run_scenarios
+from src.simulator.scenario import run_campaign
 from src.simulator.configuration import parse_configuration
 
 logging.basicConfig(
@@ -19,14 +19,11 @@ def main(config: str):
     configuration = parse_configuration(config_path)
     configuration.validate()
     logging.info(
-        "Running scenarios for genome size: %s tree count: %s leaf count: %s alpha: %s", configuration.genome_size,
-        configuration.tree_count, configuration.leaf_count, configuration.alpha)
-    current_scale = configuration.scale.begin
-    while current_scale <= configuration.scale.end:
-        logging.info(
-            "Starting iterations for scale: %s ", current_scale)
-        run_scenarios(configuration, scale=current_scale)
-        current_scale = round(current_scale + configuration.scale.step, ndigits=2)
+        "Running scenarios for genome sizes: %s tree count: %s leaf counts: %s alphas: %s scales: %s",
+        configuration.genome_sizes or configuration.genome_size, configuration.tree_count,
+        configuration.leaf_counts or configuration.leaf_count, configuration.alphas or configuration.alpha,
+        configuration.scales())
+    run_campaign(configuration)
 
 
 if __name__ == '__main__':
@@ -44,6 +44,7 @@ def process_file(output: Path, to_process: Path):
 			"total_jumps": data["total_jumps"],
 			"avg_jumps": data["avg_jumps"],
 			"alpha": data["alpha"],
-			"seed": data["seed"]
+			"seed": data["seed"],
+			"format_version": data.get("format_version", 1)
 		}
 		f.write(json.dumps(data).encode())
\ No newline at end of file
@@ -1,7 +1,9 @@
 import itertools
 import logging
+from collections import OrderedDict
 from typing import List, Set, Tuple, NamedTuple, Iterator, Optional, Dict
-from numpy.random import default_rng
+import numpy as np
+from numpy.random import default_rng, SeedSequence
 from pandas import Interval
 
 
@@ -55,11 +57,16 @@ class GenomeSegment(NamedTuple):
 
 
 class Genome:
+    NEIGHBOURHOODS_CACHE_SIZE = 4
+
     def __init__(self, genes: List[int]):
         self._genes = genes
         self._len = len(genes)
         assert self._len == len(set(self._genes)), "All genes must be unique"
-        self._neighborhoods = {}
+        self._array: Optional[np.ndarray] = None
+        self._positions: Optional[np.ndarray] = None
+        self._sorted_genes: Optional[np.ndarray] = None
+        self._neighborhoods: 'OrderedDict[int, np.ndarray]' = OrderedDict()
 
     def __eq__(self, other: 'Genome'):
         return self.len == other.len and self.genes == other.genes
@@ -81,11 +88,45 @@ class Genome:
     def genes(self) -> List[int]:
         return self._genes
 
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            self._array = np.array(self._genes, dtype=np.int64)
+        return self._array
+
+    @property
+    def positions(self) -> np.ndarray:
+        # The inverse permutation, positions[gene] is the index of the gene (-1 for genes not in the genome)
+        if self._positions is None:
+            assert not self._len or self.sorted_genes[0] >= 0, "Genes must be non negative"
+            self._positions = np.full(self.sorted_genes[-1] + 1 if self._len else 0, -1, dtype=np.int64)
+            self._positions[self.array] = np.arange(self._len)
+        return self._positions
+
+    @property
+    def sorted_genes(self) -> np.ndarray:
+        if self._sorted_genes is None:
+            self._sorted_genes = np.sort(self.array)
+        return self._sorted_genes
+
+    def neighbourhoods(self, size: int) -> np.ndarray:
+        # Row i holds the neighbourhood of sorted_genes[i]: the genes up to size positions after it, then before it
+        if size in self._neighborhoods:
+            self._neighborhoods.move_to_end(size)
+            return self._neighborhoods[size]
+        assert 0 < size * 2 < self._len
+        offsets = np.r_[np.arange(1, size + 1), -np.arange(1, size + 1)]
+        neighborhoods = self.array[(self.positions[self.sorted_genes][:, None] + offsets) % self._len]
+        self._neighborhoods[size] = neighborhoods
+        if len(self._neighborhoods) > self.NEIGHBOURHOODS_CACHE_SIZE:
+            self._neighborhoods.popitem(last=False)
+        return neighborhoods
+
     def get_neighbourhood(self, gene: int, size: int) -> Set[int]:
-        key = (gene, size)
-        if key not in self._neighborhoods:
-            self._neighborhoods[key] = get_neighbourhood(self._genes, gene, size)
-        return self._neighborhoods[key]
+        assert size * 2 < self._len
+        assert 0 <= gene < len(self.positions) and self.positions[gene] >= 0
+        offsets = np.r_[np.arange(1, size + 1), -np.arange(1, size + 1)]
+        return set(self.array[(self.positions[gene] + offsets) % self._len].tolist())
 
     def __hash__(self) -> int:
         return hash(tuple(self._genes))
@@ -98,6 +139,15 @@ def make_identity_genome(size: int) -> Genome:
     return Genome(list(range(1, size+1)))
 
 
+def position_matrix(genomes: List[Genome]) -> np.ndarray:
+    # Row l holds the position of every gene in genomes[l], columns are in ascending gene order
+    assert genomes
+    sorted_genes = genomes[0].sorted_genes
+    if any(not np.array_equal(genome.sorted_genes, sorted_genes) for genome in genomes):
+        raise ValueError("All genomes must hold the same genes")
+    return np.stack([genome.positions[sorted_genes] for genome in genomes])
+
+
 NewPositions = Dict[int, List[GenomeSegment]]
 
 
@@ -213,17 +263,82 @@ def build_new_genome(new_positions: NewPositions, stayed: Stayed) -> List[Genome
     return new_genome
 
 
+def _chain_jump_starts(rows: np.ndarray, cols: np.ndarray, sizes: np.ndarray, genome_len: int) -> np.ndarray:
+    # Every candidate points to the first candidate of the same row after its group ends, the real jump starts are
+    # the candidates reachable from the first candidate of each row. Follow the chains by pointer doubling.
+    count = len(rows)
+    keys = rows * (genome_len + 1) + cols
+    successors = np.searchsorted(keys, keys + sizes)
+    clipped = np.minimum(successors, count - 1)
+    successors[(successors == count) | (rows[clipped] != rows)] = count
+    successors = np.append(successors, count)  # The sentinel points to itself
+    marked = np.zeros(count + 1, dtype=bool)
+    marked[:count] = np.r_[True, rows[1:] != rows[:-1]]
+    while (successors[:count] != count).any():
+        marked[successors[marked]] = True
+        successors = successors[successors]
+    return marked[:count]
+
+
+def place_jumps(
+        genomes: np.ndarray, rows: np.ndarray, starts: np.ndarray, sizes: np.ndarray,
+        new_indexes: np.ndarray) -> np.ndarray:
+    edge_count, genome_len = genomes.shape
+    if not len(rows):
+        return genomes.copy()
+    order = np.lexsort((starts, new_indexes, rows))
+    rows, starts, sizes, new_indexes = rows[order], starts[order], sizes[order], new_indexes[order]
+    jump_count = len(rows)
+    exclusive = np.cumsum(sizes) - sizes
+    row_start = np.maximum.accumulate(np.where(np.r_[True, rows[1:] != rows[:-1]], np.arange(jump_count), 0))
+    exclusive -= exclusive[row_start]
+    # A group lands at its new index unless the previous group of the same row still occupies it, in which case it
+    # is placed right after it (see get_occupied_by_jumps). Rows are separated so the running max does not leak.
+    row_offset = rows * (4 * genome_len)
+    positions = np.maximum.accumulate(new_indexes - exclusive + row_offset) - row_offset + exclusive
+
+    segment_of_gene = np.repeat(np.arange(jump_count), sizes)
+    within = np.arange(len(segment_of_gene)) - (np.cumsum(sizes) - sizes)[segment_of_gene]
+    gene_rows = rows[segment_of_gene]
+    old_indexes = starts[segment_of_gene] + within
+    new_slots = positions[segment_of_gene] + within
+
+    placed = np.zeros((edge_count, 2 * genome_len), dtype=genomes.dtype)
+    occupied = np.zeros((edge_count, 2 * genome_len), dtype=bool)
+    placed[gene_rows, new_slots] = genomes[gene_rows, old_indexes]
+    occupied[gene_rows, new_slots] = True
+    jumped = np.zeros((edge_count, genome_len), dtype=bool)
+    jumped[gene_rows, old_indexes] = True
+
+    # Genes that stayed keep their order and fill the free slots from the left (see gather_stayed)
+    stayed_rows, stayed_indexes = np.nonzero(~jumped)
+    stayed_count = genome_len - jumped.sum(axis=1)
+    free_rank = np.cumsum(~occupied, axis=1) - 1
+    free_rows, free_slots = np.nonzero(~occupied & (free_rank < stayed_count[:, None]))
+    placed[free_rows, free_slots] = genomes[stayed_rows, stayed_indexes]
+    occupied[free_rows, free_slots] = True
+    return placed[occupied].reshape(edge_count, genome_len)
+
+
 class GenomeMaker:
-    def __init__(self, seed: int, alpha: float):
+    def __init__(self, seed: int, alpha: float, spawn_key: Tuple[int, ...] = ()):
         self._seed = seed
         assert 0 < alpha <= 1
         self._alpha = alpha
-        self._rndm_gen = default_rng(seed)
+        self._rndm_gen = default_rng(SeedSequence(seed, spawn_key=spawn_key))
 
     @property
     def seed(self):
         return self._seed
 
+    @property
+    def alpha(self) -> float:
+        return self._alpha
+
+    def spawn(self, key: int) -> 'GenomeMaker':
+        # An independent stream which depends only on the seed and the key, not on what was drawn so far
+        return GenomeMaker(self._seed, self._alpha, spawn_key=(key,))
+
     def make(self, genome: Genome, scale: float) -> Tuple[int, Genome]:
         assert scale != 0
         logging.debug("Original genome: %s", genome.genes)
@@ -263,6 +378,25 @@ class GenomeMaker:
             ordered_jumped.setdefault(new_index, []).append(jump)
         return ordered_jumped
 
+    def make_batch(self, genomes: np.ndarray, scales: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Same model as make, for a stack of genomes (one per row) each inherited along an edge of the given scale
+        assert genomes.ndim == 2 and len(genomes) == len(scales)
+        assert (scales != 0).all()
+        edge_count, genome_len = genomes.shape
+        jump_probabilities = self._rndm_gen.exponential(
+            scale=np.asarray(scales, dtype=float)[:, None], size=(edge_count, genome_len))
+        group_size_probabilities = self._rndm_gen.geometric(self._alpha, size=(edge_count, genome_len))
+        rows, starts = np.nonzero(jump_probabilities >= 1)
+        sizes = np.minimum(group_size_probabilities[rows, starts], genome_len - starts)
+        if len(rows):
+            jump_starts = _chain_jump_starts(rows, starts, sizes, genome_len)
+            rows, starts, sizes = rows[jump_starts], starts[jump_starts], sizes[jump_starts]
+        new_indexes = self._rndm_gen.integers(genome_len, size=len(rows))
+        overflowing = new_indexes + sizes >= genome_len
+        new_indexes[overflowing] = self._rndm_gen.integers(genome_len - sizes[overflowing] + 1)
+        logging.debug("%s Genes are jumping in %s genomes", len(rows), edge_count)
+        return np.bincount(rows, minlength=edge_count), place_jumps(genomes, rows, starts, sizes, new_indexes)
+
     def _gather_jumping(self, genome: Genome, scale: float) -> List[GenomeSegment]:
         jumping: List[GenomeSegment] = []
         index = 0
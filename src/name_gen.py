@@ -1,4 +1,37 @@
+import string
+from typing import Iterable, List
+
+BASE_26 = string.ascii_uppercase
+BASE_62 = string.ascii_uppercase + string.ascii_lowercase + string.digits
+RESERVED_NAMES = ("ROOT",)  # The Newick parser names the root ROOT
+
+
 class NameGenerator:
+    # Bijective base-k numbering over the alphabet ('A'..'Z', 'AA'..'AZ', 'BA'...), the n-th name is O(log n) long
+    def __init__(self, alphabet: str = BASE_26, reserved: Iterable[str] = RESERVED_NAMES):
+        assert len(set(alphabet)) == len(alphabet) > 1
+        self._alphabet = alphabet
+        self._reserved = set(reserved)
+        self._digits: List[int] = [0]
+
+    def _advance(self):
+        for idx in reversed(range(len(self._digits))):
+            if self._digits[idx] + 1 < len(self._alphabet):
+                self._digits[idx] += 1
+                return
+            self._digits[idx] = 0
+        self._digits.insert(0, 0)
+
+    def next(self) -> str:
+        name = "".join(self._alphabet[digit] for digit in self._digits)
+        self._advance()
+        if name in self._reserved:
+            return self.next()
+        return name
+
+
+class LegacyNameGenerator:
+    # The original naming ('A'..'Z', 'ZA'..'ZZ', 'ZZA'...), the n-th name is about n/26 long
     RANGE_START = 'A'
     RANGE_END = 'B'
 
@@ -0,0 +1,62 @@
+import gzip
+import logging
+import os
+from concurrent import futures
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from numpy.random import SeedSequence
+
+from src.genome import GenomeMaker
+from src.phylip.configuration import Configuration, GridPoint
+from src.phylip.scenario import run_scenarios
+from src.time_func import time_func
+
+
+def make_point_seed(entropy: int, point: GridPoint) -> int:
+    # Independent of the genome size and alpha, so all of them are compared on the same trees
+    state = SeedSequence(entropy, spawn_key=(point.leaf_count, round(100 * point.scale), point.idx)).generate_state(
+        1, np.uint64)
+    return int(state[0])
+
+
+def run_point(
+        point: GridPoint, neighborhood_sizes: List[int], output_path: Path, seed: int, constructor: str,
+        phylip_path: Optional[Path]):
+    with time_func(f"Running grid point: {point}"):
+        results = run_scenarios(
+            point.leaf_count, point.scale, neighborhood_sizes, point.genome_size, GenomeMaker(seed, point.alpha),
+            constructor=constructor, phylip_path=phylip_path)
+    for neighborhood_size, result in zip(neighborhood_sizes, results):
+        # Through a temporary file, as run_batch takes any existing output as done
+        output = output_path / point.file_pattern(neighborhood_size)
+        tmp_output = output.with_name(f".{output.name}.tmp")
+        with gzip.open(str(tmp_output), "w") as f_gz:
+            f_gz.write(result.to_json().encode())
+        os.replace(tmp_output, output)
+
+
+def run_batch(configuration: Configuration):
+    # Every grid point (a tree and all the neighbourhood sizes) is a job, points whose results all exist are skipped
+    points = [
+        point for point in configuration.grid()
+        if not all((configuration.output_path / point.file_pattern(size)).exists()
+                   for size in configuration.neighborhood_sizes)]
+    logging.info("Running %s grid points using %s processes", len(points), configuration.processes)
+    with futures.ProcessPoolExecutor(max_workers=configuration.processes) as executor:
+        jobs = {
+            executor.submit(
+                run_point, point, configuration.neighborhood_sizes, configuration.output_path,
+                make_point_seed(configuration.seed, point), configuration.constructor,
+                configuration.phylip_path): point
+            for point in points}
+        failed = 0
+        for job in futures.as_completed(jobs):
+            try:
+                job.result()
+            except Exception:
+                failed += 1
+                logging.exception("Failed running grid point: %s", jobs[job])
+    if failed:
+        logging.error("%s of %s grid points failed", failed, len(points))
@@ -0,0 +1,81 @@
+import itertools
+import json
+from pathlib import Path
+from typing import NamedTuple, Optional, List
+
+from numpy.random import SeedSequence
+
+from src.phylip.scenario import CONSTRUCTORS, DEFAULT_CONSTRUCTOR
+
+MAX_PROCESSES = 20
+
+
+class GridPoint(NamedTuple):
+    leaf_count: int
+    scale: float
+    genome_size: int
+    alpha: float
+    idx: int
+
+    def file_pattern(self, neighborhood_size: int) -> str:
+        return (
+            f"leaves_{self.leaf_count}_scale_{self.scale}_genome_{self.genome_size}_alpha_{self.alpha}_"
+            f"neighborhood_{neighborhood_size}_tree_{self.idx}.json.gz")
+
+
+class Configuration(NamedTuple):
+    output_path: Path
+    leaf_counts: List[int]
+    scales: List[float]
+    genome_sizes: List[int]
+    alphas: List[float]
+    neighborhood_sizes: List[int]
+    tree_count: int
+    processes: int
+    seed: int
+    constructor: str = DEFAULT_CONSTRUCTOR
+    phylip_path: Optional[Path] = None
+
+    def validate(self):
+        assert self.output_path.is_dir()
+        assert self.leaf_counts and all(leaf_count > 2 for leaf_count in self.leaf_counts)
+        assert self.scales and all(scale > 0 for scale in self.scales)
+        assert self.alphas and all(0 < alpha <= 1 for alpha in self.alphas)
+        assert self.neighborhood_sizes and self.genome_sizes
+        assert 2 * max(self.neighborhood_sizes) < min(self.genome_sizes)
+        assert self.tree_count > 0
+        assert 0 < self.processes <= MAX_PROCESSES
+        assert self.seed >= 0
+        assert self.constructor in CONSTRUCTORS, f"Unknown tree constructor: [{self.constructor}]"
+        assert self.phylip_path is None or self.phylip_path.is_dir()
+
+    def grid(self) -> List[GridPoint]:
+        return [
+            GridPoint(*point) for point in itertools.product(
+                self.leaf_counts, self.scales, self.genome_sizes, self.alphas, range(self.tree_count))]
+
+
+def parse_configuration(config_path: Path) -> Configuration:
+    assert config_path.is_file(), f"Configuration file not found at: [{config_path}]"
+    with config_path.open("r") as f:
+        configuration = json.load(f)
+
+    def get_conf_val(key: str):
+        if key not in configuration:
+            raise KeyError(f"Invalid configuration! Missing key: [{key}]")
+        return configuration[key]
+
+    phylip_path = configuration.get("phylip_path")
+    return Configuration(
+        output_path=Path(get_conf_val("output_path")).expanduser(),
+        leaf_counts=[int(leaf_count) for leaf_count in get_conf_val("leaf_counts")],
+        scales=[round(float(scale), 2) for scale in get_conf_val("scales")],
+        genome_sizes=[int(genome_size) for genome_size in get_conf_val("genome_sizes")],
+        alphas=[float(alpha) for alpha in get_conf_val("alphas")],
+        neighborhood_sizes=[int(size) for size in get_conf_val("neighborhood_sizes")],
+        tree_count=int(get_conf_val("tree_count")),
+        processes=int(get_conf_val("processes")),
+        seed=int(configuration.get("seed", SeedSequence().entropy)),
+        constructor=configuration.get("constructor", DEFAULT_CONSTRUCTOR),
+        phylip_path=Path(phylip_path).expanduser() if phylip_path is not None else None
+    )
@@ -0,0 +1,43 @@
+from typing import List, NamedTuple
+
+import numpy as np
+
+from src.genome import Genome, position_matrix
+
+
+class GeneOrderDistances(NamedTuple):
+    # All matrices are leaves x leaves, genomes are treated as circular and unsigned
+    breakpoints: np.ndarray
+    adjacencies: np.ndarray
+    shared_intervals: np.ndarray
+
+
+def _conserved_adjacencies(positions: np.ndarray, others: np.ndarray) -> np.ndarray:
+    # For every adjacency of a genome (in its order), whether it is also an adjacency of each of the other genomes
+    genome_len = len(positions)
+    by_position = np.argsort(positions)
+    distances = np.abs(others[:, np.roll(by_position, -1)] - others[:, by_position])
+    return (distances == 1) | (distances == genome_len - 1)
+
+
+def gene_order_distances(genomes: List[Genome]) -> GeneOrderDistances:
+    positions = position_matrix(genomes).astype(np.int32)
+    leaf_count, genome_len = positions.shape
+    assert genome_len > 2
+    adjacencies = np.full((leaf_count, leaf_count), genome_len)
+    shared_intervals = np.ones((leaf_count, leaf_count), dtype=int)
+    for row in range(leaf_count - 1):
+        conserved = _conserved_adjacencies(positions[row], positions[row + 1:])
+        row_adjacencies = conserved.sum(axis=1)
+        # The conserved adjacencies are the same edges in both genomes, every maximal run of them is an interval of
+        # genes which is contiguous in both. A run starts where the previous adjacency is not conserved.
+        runs = np.count_nonzero(conserved & ~np.roll(conserved, 1, axis=1), axis=1)
+        runs[row_adjacencies == genome_len] = 1
+        adjacencies[row, row + 1:] = adjacencies[row + 1:, row] = row_adjacencies
+        shared_intervals[row, row + 1:] = shared_intervals[row + 1:, row] = runs
+    return GeneOrderDistances(genome_len - adjacencies, adjacencies, shared_intervals)
+
+
+def breakpoint_distance_matrix(genomes: List[Genome]) -> np.ndarray:
+    # The fraction of adjacencies which are broken between every two genomes
+    return gene_order_distances(genomes).breakpoints / genomes[0].len
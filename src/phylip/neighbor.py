@@ -0,0 +1,113 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.tree import TreeNode
+
+# The clusters being joined are kept in the first rows (and columns) of the distance matrix, a joined cluster takes
+# the row of the first of its children and the last cluster moves into the row of the second, so every step works on
+# views of a shrinking block and the whole run needs O(n^2) memory.
+
+
+def _as_distances(distances: np.ndarray, names: List[str]) -> np.ndarray:
+    distances = np.array(distances, dtype=float)
+    if distances.ndim != 2 or distances.shape != (len(names), len(names)):
+        raise ValueError(f"Expected a {len(names)}x{len(names)} distance matrix, got: {distances.shape}")
+    if not np.allclose(distances, distances.T):
+        raise ValueError("Distance matrix must be symmetric")
+    return distances
+
+
+def _move_last(distances: np.ndarray, nodes: List[TreeNode], to: int, last: int, *arrays: np.ndarray):
+    if to == last:
+        return
+    distances[to, :last] = distances[last, :last]
+    distances[:last, to] = distances[:last, last]
+    distances[to, to] = 0
+    nodes[to] = nodes[last]
+    for array in arrays:
+        array[to] = array[last]
+
+
+def neighbor_joining(distances: np.ndarray, names: List[str]) -> TreeNode:
+    # Saitou & Nei's neighbour joining. Like Phylip's neighbor the tree is left unrooted, its root has the three
+    # clusters which remain at the end as its children.
+    distances = _as_distances(distances, names)
+    nodes = [TreeNode(idx, name=name) for idx, name in enumerate(names)]
+    next_id = len(nodes)
+    size = len(nodes)
+    sums = distances.sum(axis=1)
+    while size > 3:
+        block = distances[:size, :size]
+        q = (size - 2) * block - sums[:size, None] - sums[None, :size]
+        np.fill_diagonal(q, np.inf)
+        first, second = sorted(np.unravel_index(np.argmin(q), q.shape))
+        joined = block[first, second]
+        first_len = joined / 2 + (sums[first] - sums[second]) / (2 * (size - 2))
+        nodes[first].edge_len, nodes[second].edge_len = first_len, joined - first_len
+        to_joined = (block[first] + block[second] - joined) / 2
+        sums[:size] += to_joined - block[first] - block[second]
+        to_joined[first] = 0
+        sums[first] = to_joined.sum() - to_joined[second]
+        block[first], block[:, first] = to_joined, to_joined
+        nodes[first] = TreeNode(next_id, children=[nodes[first], nodes[second]])
+        next_id += 1
+        size -= 1
+        _move_last(distances, nodes, second, size, sums)
+    if size == 3:
+        block = distances[:3, :3]
+        for idx in range(3):
+            others = [other for other in range(3) if other != idx]
+            nodes[idx].edge_len = (block[idx, others].sum() - block[others[0], others[1]]) / 2
+    elif size == 2:
+        nodes[0].edge_len = nodes[1].edge_len = distances[0, 1] / 2
+    else:
+        return nodes[0]
+    return TreeNode(next_id, children=nodes[:size])
+
+
+def upgma(distances: np.ndarray, names: List[str]) -> TreeNode:
+    # Rooted and ultrametric, every cluster is placed at half the average distance between its two children
+    distances = _as_distances(distances, names)
+    nodes = [TreeNode(idx, name=name) for idx, name in enumerate(names)]
+    next_id = len(nodes)
+    size = len(nodes)
+    cluster_sizes = np.ones(size)
+    heights = np.zeros(size)
+    while size > 1:
+        block = distances[:size, :size].copy()
+        np.fill_diagonal(block, np.inf)
+        first, second = sorted(np.unravel_index(np.argmin(block), block.shape))
+        height = block[first, second] / 2
+        nodes[first].edge_len = height - heights[first]
+        nodes[second].edge_len = height - heights[second]
+        block = distances[:size, :size]
+        to_joined = (cluster_sizes[first] * block[first] + cluster_sizes[second] * block[second]) / (
+            cluster_sizes[first] + cluster_sizes[second])
+        to_joined[first] = 0
+        block[first], block[:, first] = to_joined, to_joined
+        cluster_sizes[first] += cluster_sizes[second]
+        heights[first] = height
+        nodes[first] = TreeNode(next_id, children=[nodes[first], nodes[second]])
+        next_id += 1
+        size -= 1
+        _move_last(distances, nodes, second, size, cluster_sizes, heights)
+    return nodes[0]
+
+
+TREE_BUILDERS = {
+    "nj": neighbor_joining,
+    "upgma": upgma,
+}
+
+
+class NeighborConstructor:
+    # Same interface as PhylipNeighborConstructor, without Phylip
+    def __init__(self, method: str = "nj"):
+        assert method in TREE_BUILDERS, f"Unknown tree construction method: [{method}]"
+        self._build = TREE_BUILDERS[method]
+
+    def construct(self, root: TreeNode, matrix: Dict[str, List[float]]) -> Tuple[str, str]:
+        names = list(matrix)
+        constructed = self._build(np.array([matrix[name] for name in names]), names)
+        return root.to_newick(), constructed.to_newick()
@@ -1,86 +1,92 @@
+import io
+import shutil
 import subprocess
+from contextlib import contextmanager
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import Dict, List, Tuple
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Tuple, Optional, Iterator
 
-from src.tree import TreeNode
+from src.tree import TreeNode, write_newick
 
 
-class PhylipDrawer:
+class PhylipProgram:
+    # Every call runs in a temporary working directory of its own holding the program's input files (and links to
+    # its support files), so concurrent calls never see each other's infile, intree, outfile, outtree or plotfile.
     BASE_PATH = Path("~/phylip-3.695/exe").expanduser()
-    DRAWGRAM_PATH = BASE_PATH / "drawgram.app/Contents/MacOS/drawgram"
-    FONT_PATH = BASE_PATH / "font5"
-    OUTPUT_PATH = BASE_PATH / "plotfile"
-    INPUT_PATH = BASE_PATH / "intree"
+    PROGRAM = ""
+    SUPPORT_FILES: Tuple[str, ...] = ()  # Glob patterns of files under the base path the program reads
 
-    def __init__(self):
-        assert self.BASE_PATH.exists()
-        assert self.DRAWGRAM_PATH.exists()
-        assert self.DRAWGRAM_PATH.is_file()
+    def __init__(self, base_path: Optional[Path] = None):
+        self._base_path = self.BASE_PATH if base_path is None else base_path
+        assert self._base_path.exists()
+        self._executable = self.executable_path(self._base_path)
+        assert self._executable.exists()
+        assert self._executable.is_file()
 
-    def draw(self, tree: TreeNode, output: Path):
-        if self.OUTPUT_PATH.exists():
-            self.OUTPUT_PATH.unlink()
-        self.INPUT_PATH.write_text(tree.to_newick())
-        subprocess.check_call(
-            f"echo Y | {self.DRAWGRAM_PATH}", shell=True, cwd=self.BASE_PATH, stdout=subprocess.DEVNULL)
-        assert self.OUTPUT_PATH.exists()
-        self.OUTPUT_PATH.rename(output)
+    @classmethod
+    def executable_path(cls, base_path: Path) -> Path:
+        app_path = base_path / f"{cls.PROGRAM}.app/Contents/MacOS/{cls.PROGRAM}"  # The macOS builds
+        return app_path if app_path.exists() else base_path / cls.PROGRAM
 
+    @contextmanager
+    def _run(self, inputs: Dict[str, str], answers: str) -> Iterator[Path]:
+        # Runs the program answering its menu with the given text, yields its working directory
+        with TemporaryDirectory(prefix=f"{self.PROGRAM}_") as workdir:
+            workdir = Path(workdir)
+            for pattern in self.SUPPORT_FILES:
+                for support_file in self._base_path.glob(pattern):
+                    (workdir / support_file.name).symlink_to(support_file)
+            for name, text in inputs.items():
+                (workdir / name).write_text(text)
+            subprocess.run(
+                [str(self._executable)], input=answers, text=True, cwd=workdir, stdout=subprocess.DEVNULL,
+                check=True)
+            yield workdir
+
+
+class PhylipDrawer(PhylipProgram):
+    PROGRAM = "drawgram"
+    SUPPORT_FILES = ("font*",)
+    OUTPUT_FILE = "plotfile"
+    INPUT_FILE = "intree"
+
+    def draw(self, tree: TreeNode, output: Path):
+        newick = io.StringIO()
+        write_newick(tree, newick)
+        with self._run({self.INPUT_FILE: newick.getvalue()}, "Y\n") as workdir:
+            assert (workdir / self.OUTPUT_FILE).exists()
+            shutil.move(str(workdir / self.OUTPUT_FILE), str(output))
 
-class PhylipNeighborConstructor:
-    BASE_PATH = Path("~/phylip-3.695/exe").expanduser()
-    NEIGHBOR_PATH = BASE_PATH / "neighbor.app/Contents/MacOS/neighbor"
-    OUT_TREE = BASE_PATH / "outtree"
-    OUTPUT_PATHS = [OUT_TREE, BASE_PATH / "outfile"]
-    INPUT_PATH = BASE_PATH / "infile"
 
-    def __init__(self):
-        assert self.BASE_PATH.exists()
-        assert self.NEIGHBOR_PATH.exists()
-        assert self.NEIGHBOR_PATH.is_file()
+class PhylipNeighborConstructor(PhylipProgram):
+    PROGRAM = "neighbor"
+    OUT_TREE = "outtree"
+    OUTPUT_FILES = [OUT_TREE, "outfile"]
+    INPUT_FILE = "infile"
 
     def construct(self, root: TreeNode, matrix: Dict[str, List[float]]) -> Tuple[str, str]:
-        for f in self.OUTPUT_PATHS:
-            if f.exists():
-                f.unlink()
         text = f'  {len(matrix)}\n' + '\n'.join(
             name + ' '*9 + '  '.join(
                 str(round(distance, 4)).ljust(6, '0') for distance in distances) for name, distances in matrix.items())
-        self.INPUT_PATH.write_text(text)
-        subprocess.check_call(
-            f"echo Y | {self.NEIGHBOR_PATH}", shell=True, cwd=self.BASE_PATH, stdout=subprocess.DEVNULL)
-        for f in self.OUTPUT_PATHS:
-            assert f.exists()
+        with self._run({self.INPUT_FILE: text}, "Y\n") as workdir:
+            for f in self.OUTPUT_FILES:
+                assert (workdir / f).exists()
+            constructed_tree = (workdir / self.OUT_TREE).read_text().replace("\n", "")
         orig_tree = root.to_newick()
-        constructed_tree = self.OUT_TREE.read_text().replace("\n", "")
         return orig_tree, constructed_tree
 
 
-class PhylipTreeDistCalculator:
-    BASE_PATH = Path("~/phylip-3.695/exe").expanduser()
-    TREE_DIST_PATH = BASE_PATH / "treedist.app/Contents/MacOS/treedist"
-    OUTPUT_PATH = BASE_PATH / "outfile"
-    INPUT_PATH = BASE_PATH / "intree"
-
-    def __init__(self):
-        assert self.BASE_PATH.exists()
-        assert self.TREE_DIST_PATH.exists()
-        assert self.TREE_DIST_PATH.is_file()
+class PhylipTreeDistCalculator(PhylipProgram):
+    PROGRAM = "treedist"
+    OUTPUT_FILE = "outfile"
+    INPUT_FILE = "intree"
 
     def calc(self, tree1: str, tree2: str, use_edge_length: bool = True) -> float:
-        if self.OUTPUT_PATH.exists():
-            self.OUTPUT_PATH.unlink()
-        self.INPUT_PATH.write_text(tree1 + '\n' + tree2)
-        with NamedTemporaryFile("w") as input_file:
-            options = "Y"
-            if not use_edge_length:
-                options = f"D\n{options}"
-            input_file.write(options)
-            input_file.flush()
-            subprocess.check_call(
-                f"{self.TREE_DIST_PATH} < {input_file.name}", shell=True, cwd=self.BASE_PATH, stdout=subprocess.DEVNULL)
-        assert self.OUTPUT_PATH.exists()
-        text = self.OUTPUT_PATH.read_text().strip()
+        options = "Y\n"
+        if not use_edge_length:
+            options = f"D\n{options}"
+        with self._run({self.INPUT_FILE: tree1 + '\n' + tree2}, options) as workdir:
+            assert (workdir / self.OUTPUT_FILE).exists()
+            text = (workdir / self.OUTPUT_FILE).read_text().strip()
         last_line = text.split('\n')[-1]
         return float(last_line.replace("Trees 1 and 2:", "").strip())
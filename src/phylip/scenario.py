@@ -1,14 +1,27 @@
 import json
 import logging
-import time
-from typing import NamedTuple
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Sequence, Optional
 
 from src.genome import GenomeMaker
-from src.phylip.newick import NewickParser
-from src.phylip.phylip import PhylipNeighborConstructor, PhylipTreeDistCalculator
-from src.phylip.synteny_index import calculate_synteny_distance
+from src.phylip.neighbor import NeighborConstructor, TREE_BUILDERS
+from src.phylip.phylip import PhylipNeighborConstructor
+from src.phylip.synteny_index import synteny_distance_matrix
+from src.phylip.tree_dist import tree_distance
 from src.time_func import time_func
-from src.tree import TreeDesc, YuleTreeGenerator, fill_genome
+from src.tree import TreeDesc, YuleTreeGenerator, fill_genome, TreeNode, BranchLenStats, FlatTree
+
+
+PHYLIP_CONSTRUCTOR = "phylip"
+CONSTRUCTORS = (*TREE_BUILDERS, PHYLIP_CONSTRUCTOR)  # Phylip's neighbor runs as a subprocess, the rest are built in
+DEFAULT_CONSTRUCTOR = "nj"
+
+
+def make_constructor(constructor: str, phylip_path: Optional[Path] = None):
+    assert constructor in CONSTRUCTORS, f"Unknown tree constructor: [{constructor}]"
+    if constructor == PHYLIP_CONSTRUCTOR:
+        return PhylipNeighborConstructor(phylip_path)
+    return NeighborConstructor(constructor)
 
 
 class Result(NamedTuple):
@@ -37,9 +50,47 @@ class Result(NamedTuple):
         return json.dumps(data, indent=4)
 
 
-def run_scenario(
-    size: int, scale: float, neighborhood_size: int, genome_size: int,
-        genome_maker: GenomeMaker) -> Result:
+def reconstruct(
+        root: TreeNode, branch_stats: BranchLenStats, distance_matrix: Dict[str, List[float]], genome_size: int,
+        neighborhood_size: int, scale: float, constructor: str = DEFAULT_CONSTRUCTOR,
+        phylip_path: Optional[Path] = None) -> Result:
+    with time_func(f"Running {constructor} tree constructor"):
+        orig, constructed = make_constructor(constructor, phylip_path).construct(root, distance_matrix)
+    constructed_tree = FlatTree.from_newick(constructed, synthetic_names=True)
+    with time_func("Calculating tree distances"):
+        distance = tree_distance(root, constructed_tree)
+    logging.debug("Original tree: ")
+    logging.debug(orig)
+    logging.debug("Constructed tree:")
+    logging.debug(constructed)
+    logging.debug("Tree distance: %s", distance)
+    # The rates and internal branch counts are taken over the internal splits, the two edges below a root with two
+    # children make a single split
+    internal_branches_orig = distance.first_edges
+    internal_branches_constructed = distance.second_edges
+    if distance.first_edges == 0:
+        fp = 1
+    else:
+        fp = (distance.first_edges - distance.common_edges) / distance.first_edges
+    if distance.second_edges == 0:
+        fn = 1
+    else:
+        fn = (distance.second_edges - distance.common_edges) / distance.second_edges
+    logging.debug("False positive estimator: %s", fp)
+    logging.debug("False negative estimator: %s", fn)
+    model_tree = TreeDesc(orig, internal_branches_orig, branch_stats)
+    constructed_tree = TreeDesc(constructed, internal_branches_constructed, constructed_tree.branch_len_stats())
+    return Result(
+        model_tree, constructed_tree, genome_size, neighborhood_size, scale, distance.symmetric_difference,
+        fp, fn, distance.branch_score
+    )
+
+
+def run_scenarios(
+    size: int, scale: float, neighborhood_sizes: Sequence[int], genome_size: int,
+        genome_maker: GenomeMaker, processes: int = 1, constructor: str = DEFAULT_CONSTRUCTOR,
+        phylip_path: Optional[Path] = None) -> List[Result]:
+    # Simulates a single tree and reconstructs it once for every neighbourhood size
     with time_func("Constructing the Yule tree"):
         res = YuleTreeGenerator(size=size, scale=scale, seed=genome_maker.seed).construct()
     with time_func("Get branch statistics"):
@@ -52,78 +103,21 @@ def run_scenario(
         fill_genome(res.root, genome_size=genome_size, maker=genome_maker, total_jumped=total_jumped)
     assert len(res.leaves) == size
 
-    leaves_matrix = {}
-
-    def fill_leaves_matrix():
-        for row, l1 in enumerate(res.leaves):
-            for l2 in res.leaves:
-                leaves_matrix.setdefault(row, []).append((l1, l2))
-    with time_func("Filling leaves matrix"):
-        fill_leaves_matrix()
-    distance_matrix = {}
+    with time_func(f"Filling distance matrices, neighborhood sizes: {neighborhood_sizes}"):
+        matrices = synteny_distance_matrix(
+            [leaf.genome for leaf in res.leaves], list(neighborhood_sizes), processes=processes)
+    results = []
+    for neighborhood_size, matrix in zip(neighborhood_sizes, matrices):
+        distance_matrix = {leaf.name: distances for leaf, distances in zip(res.leaves, matrix.tolist())}
+        results.append(reconstruct(
+            res.root, branch_stats, distance_matrix, genome_size, neighborhood_size, scale, constructor, phylip_path))
+    return results
 
-    def fill_distance_matrix():
-        calculated = {}
-        durations = []
-        for leave_vector in leaves_matrix.values():
-            for l1, l2 in leave_vector:
-                name1 = l1.name
-                name2 = l2.name
-                key = tuple(sorted([name1, name2]))
-                if key in calculated:
-                    distance = calculated[key]
-                else:
-                    if l1.name == l2.name:  # Small optimization
-                        distance = 0
-                    else:
-                        time_before_call = time.monotonic()
-                        distance = calculate_synteny_distance(l1.genome, l2.genome, neighborhood_size)
-                        duration = time.monotonic() - time_before_call
-                        durations.append(duration)
 
-                    calculated[key] = distance
-                distance_matrix.setdefault(l1.name, []).append(distance)
-        total = sum(durations)
-        size = len(durations)
-        max_duration = max(durations)
-        logging.info(
-            "Number of calculations: %s avg duration: %s max duration: %s total duration: %s", size, total / size, max_duration, total)
-    with time_func("Filling distance matrix"):
-        fill_distance_matrix()
-
-    constructor = PhylipNeighborConstructor()
-    with time_func("Runing Phylip Neighbor constructor"):
-        orig, constructed = constructor.construct(res.root, distance_matrix)
-    distance_calc = PhylipTreeDistCalculator()
-    with time_func("Runing Phylip TreeDist"):
-        distance_res = distance_calc.calc(orig, constructed)
-    logging.debug("Original tree: ")
-    logging.debug(orig)
-    logging.debug("Constructed tree:")
-    logging.debug(constructed)
-    logging.debug("TreeDist result:")
-    logging.debug(distance_res)
-    internal_branches_orig = len([c for c in orig if c == ')']) - 1
-    internal_branches_constructed = len([c for c in constructed if c == ')']) - 1
-    distance_without_len = distance_calc.calc(orig, constructed, False)
-    assert distance_without_len // 1 == distance_without_len
-    distance_without_len = int(distance_without_len)
-    logging.debug("Distance without len: %s", distance_without_len)
-    common_edges = ((internal_branches_orig + internal_branches_constructed) - distance_without_len) / 2
-    if internal_branches_orig == 0:
-        fp = 1
-    else:
-        fp = (internal_branches_orig - common_edges) / internal_branches_orig
-    if internal_branches_constructed == 0:
-        fn = 1
-    else:
-        fn = (internal_branches_constructed - common_edges) / internal_branches_constructed
-    logging.debug("False positive estimator: %s", fp)
-    logging.debug("False negative estimator: %s", fn)
-    model_tree = TreeDesc(orig, internal_branches_orig, branch_stats)
-    constructed_res = NewickParser(constructed).parse()
-    constructed_tree = TreeDesc(constructed, internal_branches_constructed, constructed_res.root.branch_len_stats())
-    return Result(
-        model_tree, constructed_tree, genome_size, neighborhood_size, scale, distance_without_len,
-        fp, fn, distance_res
-    )
+def run_scenario(
+    size: int, scale: float, neighborhood_size: int, genome_size: int,
+        genome_maker: GenomeMaker, processes: int = 1, constructor: str = DEFAULT_CONSTRUCTOR,
+        phylip_path: Optional[Path] = None) -> Result:
+    return run_scenarios(
+        size, scale, [neighborhood_size], genome_size, genome_maker, processes=processes, constructor=constructor,
+        phylip_path=phylip_path)[0]
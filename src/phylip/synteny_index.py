@@ -1,4 +1,14 @@
-from src.genome import Genome
+import itertools
+import logging
+import numbers
+from concurrent import futures
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.genome import Genome, position_matrix
+
+NeighborhoodSizes = Union[int, Sequence[int]]
 
 
 def calculate_synteny_index(g1: Genome, g2: Genome, gene: int, neighborhood_size: int) -> int:
@@ -7,12 +17,120 @@ def calculate_synteny_index(g1: Genome, g2: Genome, gene: int, neighborhood_size
     return len(n1 & n2)
 
 
-def calculate_synteny_distance(g1: Genome, g2: Genome, neighborhood_size: int) -> float:
-    set1 = set(g1.genes)
-    set2 = set(g2.genes)
-    all_genes = set1 | set2
-    intersection = all_genes & set1 & set2
-    sum_ = 0
-    for gene in intersection:
-        sum_ += calculate_synteny_index(g1, g2, gene, neighborhood_size)
-    return 1 - ((sum_ / (2*neighborhood_size)) / len(all_genes))
+def _is_single_size(neighborhood_size: NeighborhoodSizes) -> bool:
+    # numpy integers (e.g. taken from an array of sizes) are a single size as well
+    return isinstance(neighborhood_size, numbers.Integral)
+
+
+def _as_sizes(neighborhood_size: NeighborhoodSizes) -> List[int]:
+    sizes = [neighborhood_size] if _is_single_size(neighborhood_size) else list(neighborhood_size)
+    sizes = [int(size) for size in sizes]
+    assert sizes and all(size > 0 for size in sizes)
+    return sizes
+
+
+def _rings(max_size: int) -> np.ndarray:
+    # The ring of every column of Genome.neighbourhoods, a neighbour in ring r belongs to all sizes >= r
+    return np.tile(np.arange(1, max_size + 1), 2)
+
+
+def count_shared_neighbours_by_size(n1: np.ndarray, n2: np.ndarray) -> np.ndarray:
+    # Neighbourhoods are nested, a gene shared by the neighbourhoods of size max_size is shared by all the sizes which
+    # hold it in both genomes. Returns the number of shared neighbours for every size up to max_size (index = size).
+    max_size = n1.shape[-1] // 2
+    merged = np.concatenate((n1, n2), axis=-1)
+    rings = np.broadcast_to(np.tile(_rings(max_size), 2), merged.shape)
+    order = np.argsort(merged, axis=-1)
+    merged = np.take_along_axis(merged, order, axis=-1)
+    rings = np.take_along_axis(rings, order, axis=-1)
+    shared = merged[..., 1:] == merged[..., :-1]
+    first_size = np.maximum(rings[..., 1:], rings[..., :-1])[shared]
+    return np.cumsum(np.bincount(first_size, minlength=max_size + 1))
+
+
+def calculate_synteny_distance(
+        g1: Genome, g2: Genome, neighborhood_size: NeighborhoodSizes) -> Union[float, List[float]]:
+    # Given a list of sizes, returns the distance for each of them from a single pass over the largest one
+    sizes = _as_sizes(neighborhood_size)
+    max_size = max(sizes)
+    intersection, idx1, idx2 = np.intersect1d(
+        g1.sorted_genes, g2.sorted_genes, assume_unique=True, return_indices=True)
+    all_genes = g1.len + g2.len - len(intersection)
+    shared = np.zeros(max_size + 1, dtype=int)
+    if len(intersection):
+        shared = count_shared_neighbours_by_size(
+            g1.neighbourhoods(max_size)[idx1], g2.neighbourhoods(max_size)[idx2])
+    distances = [1 - ((int(shared[size]) / (2*size)) / all_genes) for size in sizes]
+    return distances[0] if _is_single_size(neighborhood_size) else distances
+
+
+MAX_BLOCK_ELEMENTS = 2 ** 22
+_positions: Optional[np.ndarray] = None
+
+
+def _init_worker(positions: np.ndarray):
+    # Pool workers get the positions once, instead of with every row
+    global _positions
+    _positions = positions
+
+
+def _neighbour_ranks(positions: np.ndarray, row: int, neighborhood_size: int) -> np.ndarray:
+    genome_len = positions.shape[1]
+    by_position = np.argsort(positions[row])
+    offsets = np.r_[np.arange(1, neighborhood_size + 1), -np.arange(1, neighborhood_size + 1)]
+    return by_position[(positions[row][:, None] + offsets) % genome_len]
+
+
+def _shared_neighbours_row(row: int, sizes: List[int], positions: Optional[np.ndarray] = None) -> np.ndarray:
+    # Counts the shared neighbours of genomes[row] with every genome after it, for every size. x is a neighbour of g
+    # in a genome iff their circular distance there is at most the neighbourhood size, so take the neighbours of every
+    # gene in genomes[row] and check their distance from it in the other genomes. The positions are those of the pool
+    # worker when not given.
+    if positions is None:
+        positions = _positions
+    leaf_count, genome_len = positions.shape
+    max_size = max(sizes)
+    neighbours = _neighbour_ranks(positions, row, max_size)
+    rings = _rings(max_size).astype(positions.dtype)
+    genes = np.arange(genome_len)[:, None]
+    block = max(1, MAX_BLOCK_ELEMENTS // neighbours.size)
+    counts = []
+    for start in range(row + 1, leaf_count, block):
+        others = positions[start:start + block]
+        distances = np.abs(others[:, neighbours] - others[:, genes])
+        first_size = np.maximum(np.minimum(distances, genome_len - distances), rings)
+        counts.append(np.stack([np.count_nonzero(first_size <= size, axis=(1, 2)) for size in sizes], axis=1))
+    return np.concatenate(counts) if counts else np.zeros((0, len(sizes)), dtype=int)
+
+
+def synteny_distance_matrix(
+        genomes: List[Genome], neighborhood_size: NeighborhoodSizes,
+        processes: int = 1) -> Union[np.ndarray, List[np.ndarray]]:
+    # Given a list of sizes, returns a matrix for each of them from a single sweep over the genomes
+    sizes = _as_sizes(neighborhood_size)
+    leaf_count = len(genomes)
+    matrices = [np.zeros((leaf_count, leaf_count)) for _ in sizes]
+    try:
+        positions = position_matrix(genomes).astype(np.int32)
+    except ValueError:
+        logging.warning("Genomes hold different genes, calculating the distances pair by pair")
+        for row, col in itertools.combinations(range(leaf_count), 2):
+            distances = calculate_synteny_distance(genomes[row], genomes[col], sizes)
+            for matrix, distance in zip(matrices, distances):
+                matrix[row, col] = matrix[col, row] = distance
+        return matrices[0] if _is_single_size(neighborhood_size) else matrices
+    genome_len = positions.shape[1]
+    assert max(sizes) * 2 < genome_len
+    rows = range(leaf_count - 1)
+    if processes == 1:
+        counts = [_shared_neighbours_row(row, sizes, positions) for row in rows]
+    else:
+        with futures.ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker, initargs=(positions,)) as executor:
+            counts = list(executor.map(_shared_neighbours_row, rows, itertools.repeat(sizes)))
+    for row, row_counts in zip(rows, counts):
+        for matrix, size, size_counts in zip(matrices, sizes, row_counts.T):
+            distances = 1 - ((size_counts / (2*size)) / genome_len)
+            matrix[row, row + 1:] = distances
+            matrix[row + 1:, row] = distances
+    return matrices[0] if _is_single_size(neighborhood_size) else matrices
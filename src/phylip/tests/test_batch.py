@@ -0,0 +1,41 @@
+import gzip
+import json
+from pathlib import Path
+
+from src.phylip.batch import run_batch, make_point_seed
+from src.phylip.configuration import parse_configuration, GridPoint
+
+
+def test_run_batch(tmp_path: Path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "output_path": str(tmp_path),
+        "leaf_counts": [8],
+        "scales": [0.1, 0.2],
+        "genome_sizes": [64],
+        "alphas": [0.5, 1],
+        "neighborhood_sizes": [2, 4],
+        "tree_count": 2,
+        "processes": 2,
+        "seed": 7
+    }))
+    configuration = parse_configuration(config_path)
+    configuration.validate()
+    assert len(configuration.grid()) == 8
+    run_batch(configuration)
+    outputs = sorted(tmp_path.glob("*.json.gz"))
+    assert len(outputs) == 16
+    assert not list(tmp_path.glob(".*.tmp"))
+    for output in outputs:
+        with gzip.open(str(output), "r") as f:
+            assert json.loads(f.read().decode())["neighborhood_size"] in (2, 4)
+    modified = {output: output.stat().st_mtime_ns for output in outputs}
+    run_batch(configuration)
+    assert {output: output.stat().st_mtime_ns for output in outputs} == modified
+
+
+def test_point_seeds():
+    point = GridPoint(8, 0.1, 64, 0.5, 0)
+    assert make_point_seed(7, point) == make_point_seed(7, point._replace(genome_size=128, alpha=1))
+    assert make_point_seed(7, point) != make_point_seed(7, point._replace(idx=1))
+    assert make_point_seed(7, point) != make_point_seed(8, point)
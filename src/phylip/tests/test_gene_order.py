@@ -0,0 +1,51 @@
+import itertools
+from typing import List, Set, FrozenSet
+
+import numpy as np
+import pytest
+from numpy.random import default_rng
+
+from src.genome import Genome
+from src.phylip.gene_order import gene_order_distances, breakpoint_distance_matrix
+
+
+def _adjacencies(genes: List[int]) -> Set[FrozenSet[int]]:
+    return {frozenset((gene, genes[(idx + 1) % len(genes)])) for idx, gene in enumerate(genes)}
+
+
+def _count_runs(genes: List[int], conserved: Set[FrozenSet[int]]) -> int:
+    flags = [adjacency in conserved for adjacency in (
+        frozenset((gene, genes[(idx + 1) % len(genes)])) for idx, gene in enumerate(genes))]
+    if all(flags):
+        return 1
+    return sum(1 for idx, flag in enumerate(flags) if flag and not flags[idx - 1])
+
+
+def _shuffle_blocks(rng, genes: List[int]) -> List[int]:
+    cuts = sorted(rng.choice(range(1, len(genes)), size=4, replace=False).tolist())
+    blocks = [genes[start:end] for start, end in zip([0] + cuts, cuts + [len(genes)])]
+    rng.shuffle(blocks)
+    return [gene for block in blocks for gene in (reversed(block) if rng.random() < 0.5 else block)]
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_gene_order_distances(seed: int):
+    rng = default_rng(seed)
+    genes = list(range(1, 41))
+    genomes = [Genome(genes)]
+    for _ in range(5):
+        genomes.append(Genome(_shuffle_blocks(rng, genomes[-1].genes)))
+    genomes.append(Genome(rng.permutation(genes).tolist()))
+    distances = gene_order_distances(genomes)
+    for row, col in itertools.product(range(len(genomes)), repeat=2):
+        conserved = _adjacencies(genomes[row].genes) & _adjacencies(genomes[col].genes)
+        assert distances.adjacencies[row, col] == len(conserved)
+        assert distances.breakpoints[row, col] == len(genes) - len(conserved)
+        assert distances.shared_intervals[row, col] == _count_runs(genomes[row].genes, conserved)
+    assert np.array_equal(distances.shared_intervals, distances.shared_intervals.T)
+
+
+def test_breakpoint_distance_matrix():
+    genes = list(range(1, 21))
+    genomes = [Genome(genes), Genome(list(reversed(genes))), Genome(genes[10:] + genes[:10])]
+    assert np.allclose(breakpoint_distance_matrix(genomes), 0)
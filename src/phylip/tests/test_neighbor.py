@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.phylip.neighbor import neighbor_joining, upgma, NeighborConstructor
+from src.phylip.newick import NewickParser
+from src.tree import YuleTreeGenerator, TreeNode, ULTRAMETRIC_EXTEND
+
+
+def _leaf_distances(root: TreeNode) -> dict:
+    # The length of the path between every pair of leaves
+    neighbours = {}
+    to_visit = [root]
+    while to_visit:
+        node = to_visit.pop()
+        for child in node.children:
+            neighbours.setdefault(node, []).append((child, child.edge_len))
+            neighbours.setdefault(child, []).append((node, child.edge_len))
+        to_visit.extend(node.children)
+    leaves = [node for node in neighbours if not node.children]
+    distances = {}
+    for leaf in leaves:
+        to_visit = [(leaf, None, 0.0)]
+        while to_visit:
+            node, previous, distance = to_visit.pop()
+            if not node.children and node is not leaf:
+                distances[leaf.name, node.name] = distance
+            to_visit.extend(
+                (other, node, distance + edge_len) for other, edge_len in neighbours[node] if other is not previous)
+    return distances
+
+
+def _matrix(root: TreeNode):
+    distances = _leaf_distances(root)
+    names = sorted({name for name, _ in distances})
+    return np.array([[distances.get((row, col), 0.0) for col in names] for row in names]), names
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("size", (3, 4, 32))
+def test_neighbor_joining_additive(seed: int, size: int):
+    tree = YuleTreeGenerator(size=size, scale=0.5, seed=seed).construct()
+    matrix, names = _matrix(tree.root)
+    constructed = neighbor_joining(matrix, names)
+    assert len(constructed.children) == 3
+    constructed_matrix, constructed_names = _matrix(constructed)
+    assert constructed_names == names
+    assert np.allclose(constructed_matrix, matrix)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_upgma_ultrametric(seed: int):
+    tree = YuleTreeGenerator(size=32, scale=0.5, seed=seed).construct(True, ULTRAMETRIC_EXTEND)
+    matrix, names = _matrix(tree.root)
+    constructed = upgma(matrix, names)
+    assert len(constructed.children) == 2
+    assert np.allclose(_matrix(constructed)[0], matrix)
+
+
+def test_neighbor_joining_small():
+    assert neighbor_joining(np.zeros((1, 1)), ["A"]).name == "A"
+    root = neighbor_joining(np.array([[0, 2.0], [2.0, 0]]), ["A", "B"])
+    assert [(child.name, child.edge_len) for child in root.children] == [("A", 1.0), ("B", 1.0)]
+    with pytest.raises(ValueError):
+        neighbor_joining(np.array([[0, 1.0], [2.0, 0]]), ["A", "B"])
+
+
+@pytest.mark.parametrize("method", ("nj", "upgma"))
+def test_neighbor_constructor(method: str):
+    tree = YuleTreeGenerator(size=16, scale=0.5, seed=3).construct(True)
+    matrix, names = _matrix(tree.root)
+    orig, constructed = NeighborConstructor(method).construct(
+        tree.root, {name: row for name, row in zip(names, matrix.tolist())})
+    assert orig == tree.root.to_newick()
+    res = NewickParser(constructed).parse()
+    assert set(names) <= set(res.tree_map)
@@ -0,0 +1,147 @@
+import gc
+import gzip
+import io
+from concurrent import futures
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import numpy as np
+
+from src.phylip.newick import NewickParser, iter_newick_trees, iter_newick_strings, parse_flat_newick
+from src.tree import YuleTreeGenerator, TreeNode, node_depths, FlatTree
+
+
+def _nodes(root: TreeNode):
+    to_visit = [root]
+    while to_visit:
+        node = to_visit.pop()
+        yield node
+        to_visit.extend(node.children)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_parse_round_trip(seed: int):
+    tree = YuleTreeGenerator(size=64, scale=0.5, seed=seed).construct(seed % 2 == 0)
+    newick = tree.root.to_newick()
+    res = NewickParser(newick).parse()
+    leaves = {leaf.name: leaf for leaf in tree.leaves}
+    parsed_leaves = [node for node in _nodes(res.root) if not node.children]
+    assert sorted(leaf.name for leaf in parsed_leaves) == sorted(leaves)
+    for leaf in parsed_leaves:
+        assert leaf.edge_len == pytest.approx(leaves[leaf.name].edge_len)
+        assert leaf.distance_from_root() == pytest.approx(leaves[leaf.name].distance_from_root())
+    assert res.root.branch_len_stats() == tree.root.branch_len_stats()
+
+
+def test_parse():
+    res = NewickParser("((A:1,B:2):3:50,C:4);").parse()
+    root = res.root
+    assert root.name == "ROOT" and root.edge_len is None and root.id == 4
+    internal, c = root.children
+    assert (internal.name, internal.edge_len, internal.btstrp, internal.id) == ("A-B", 3.0, 50.0, 2)
+    assert [(child.name, child.edge_len, child.id) for child in internal.children] == [("A", 1.0, 0), ("B", 2.0, 1)]
+    assert (c.name, c.edge_len, c.id, c.father) == ("C", 4.0, 3, root)
+    assert {name: node.id for name, node in res.tree_map.items()} == {"A": 0, "B": 1, "A-B": 2, "C": 3, None: 4}
+
+
+def test_synthetic_names():
+    res = NewickParser("((A:1,B:2):3,(C:4,D:5):6);", synthetic_names=True).parse()
+    assert [child.name for child in res.root.children] == ["#2", "#5"]
+    assert set(res.tree_map) == {"A", "B", "#2", "C", "D", "#5", None}
+
+
+def test_parse_deep_tree():
+    depth = 20000
+    newick = "(" * depth + "A:1" + "".join(f",B{idx}:1):1" for idx in range(depth - 1)) + ",C:1);"
+    res = NewickParser(newick).parse()
+    assert len(res.tree_map) == 2 * depth + 1
+    assert node_depths(res.root)[1].max() == depth
+
+
+@pytest.mark.parametrize("data, error", [
+    ("", ValueError),
+    ("(A,B)", SyntaxError),
+    ("(A,B),C;", SyntaxError),
+    ("(A,(B,C);", SyntaxError),
+    ("(A,B));", SyntaxError),
+    ("(A,A);", SyntaxError),
+    ("(A,,B);", SyntaxError),
+    ("(A:x,B);", SyntaxError),
+    ("(A:1(,B);", SyntaxError),
+])
+def test_parse_errors(data: str, error: type):
+    with pytest.raises(error):
+        NewickParser(data).parse()
+    with pytest.raises(error):
+        parse_flat_newick(data)
+
+
+def _assert_same_flat_trees(first: FlatTree, second: FlatTree):
+    for first_field, second_field in zip(first, second):
+        if isinstance(first_field, np.ndarray):
+            assert np.array_equal(first_field, second_field, equal_nan=True)
+        else:
+            assert first_field == second_field
+
+
+@pytest.mark.parametrize("synthetic_names", (False, True))
+@pytest.mark.parametrize("data", [
+    "A;",
+    "A:0;",
+    "(A,B);",
+    "(A,B):0;",
+    "((A:1,B:2):3:50,C:4);",
+    "(A:1e-3,(B:.5,(C,D)),E:2);",
+    "((ä:1,ö:2):1,ü:3);",
+    "((A,B)X:1,C);",  # Labels after a subtree are left to NewickParser
+] + [YuleTreeGenerator(size=50, scale=0.5, seed=seed).construct(seed % 2 == 0).root.to_newick() for seed in range(4)])
+def test_parse_flat_newick(data: str, synthetic_names: bool):
+    _assert_same_flat_trees(
+        parse_flat_newick(data, synthetic_names),
+        FlatTree.from_tree_node(NewickParser(data, synthetic_names=synthetic_names).parse().root))
+
+
+def _write_trees(path: Path, trees: List[str]):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(str(path), "wt") as f:
+        for tree in trees:
+            f.write(tree[:len(tree) // 2] + "\n" + tree[len(tree) // 2:] + "\n")
+
+
+@pytest.mark.parametrize("file_name", ("trees.nwk", "trees.nwk.gz"))
+@pytest.mark.parametrize("processes", (1, 2))
+def test_iter_newick_trees(tmp_path, file_name: str, processes: int):
+    trees = [YuleTreeGenerator(size=16, scale=0.5, seed=seed).construct() for seed in range(20)]
+    path = tmp_path / file_name
+    _write_trees(path, [tree.root.to_newick() for tree in trees])
+    parsed = list(iter_newick_trees(path, processes=processes, chunk_size=64))
+    assert len(parsed) == len(trees)
+    for tree, res in zip(trees, parsed):
+        assert res.root.branch_len_stats() == tree.root.branch_len_stats()
+        assert {leaf.name for leaf in tree.leaves} <= set(res.tree_map)
+    flat = list(iter_newick_trees(path, flat=True, processes=processes))
+    assert [tree.branch_len_stats() for tree in flat] == [tree.root.branch_len_stats() for tree in trees]
+
+
+def test_iter_newick_strings():
+    stream = io.StringIO("(A,B);\n(C,\nD);  \n")
+    assert list(iter_newick_strings(stream, chunk_size=3)) == ["(A,B);", "(C,D);"]
+    with pytest.raises(SyntaxError):
+        list(iter_newick_trees(io.StringIO("(A,B);(C,D)")))
+
+
+def test_concurrent_parses_restore_gc():
+    assert gc.isenabled()
+    trees = [f"({','.join(f'L{idx}_{leaf}:0.1' for leaf in range(2000))});" for idx in range(8)]
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(5):
+            list(executor.map(lambda tree: NewickParser(tree).parse(), trees))
+            assert gc.isenabled()
+    gc.disable()
+    try:
+        NewickParser(trees[0]).parse()
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
@@ -0,0 +1,76 @@
+import stat
+import sys
+from concurrent import futures
+from pathlib import Path
+
+import pytest
+
+from src.phylip.phylip import PhylipNeighborConstructor, PhylipTreeDistCalculator, PhylipDrawer
+from src.tree import TreeNode
+
+# Stand-ins for the Phylip programs, they read their menu answers and files like the real ones
+FAKE_PROGRAMS = {
+    "neighbor": """
+import time
+assert input() == "Y"
+names = [line.split()[0] for line in open("infile").read().splitlines()[1:]]
+time.sleep(0.05)
+open("outtree", "w").write("(" + ",\\n".join(f"{name}:1.0" for name in names) + ");\\n")
+open("outfile", "w").write("done")
+""",
+    "treedist": """
+answers = [input()]
+if answers[0] == "D":
+    answers.append(input())
+trees = open("intree").read().splitlines()
+assert len(trees) == 2
+open("outfile", "w").write("Tree distances\\n\\nTrees 1 and 2:    " + ("4" if answers[0] == "D" else "0.25") + "\\n")
+""",
+    "drawgram": """
+assert input() == "Y"
+open("plotfile", "w").write(open("intree").read() + open("font5").read())
+""",
+}
+
+
+@pytest.fixture
+def phylip_path(tmp_path: Path) -> Path:
+    for name, code in FAKE_PROGRAMS.items():
+        program = tmp_path / name
+        program.write_text(f"#!{sys.executable}\n{code}")
+        program.chmod(program.stat().st_mode | stat.S_IEXEC)
+    (tmp_path / "font5").write_text("FONT")
+    return tmp_path
+
+
+def test_neighbor_constructor_sandboxes(phylip_path: Path):
+    constructor = PhylipNeighborConstructor(phylip_path)
+    root = TreeNode(0, children=[TreeNode(1, name="A", edge_len=1.0), TreeNode(2, name="B", edge_len=1.0)])
+
+    def _construct(idx: int) -> str:
+        names = [f"A{idx}", f"B{idx}", f"C{idx}"]
+        return constructor.construct(root, {name: [0.0, 0.1, 0.2] for name in names})[1]
+
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        constructed = list(executor.map(_construct, range(8)))
+    assert constructed == [f"(A{idx}:1.0,B{idx}:1.0,C{idx}:1.0);" for idx in range(8)]
+    assert sorted(path.name for path in phylip_path.iterdir()) == sorted([*FAKE_PROGRAMS, "font5"])
+
+
+def test_tree_dist_calculator(phylip_path: Path):
+    calculator = PhylipTreeDistCalculator(phylip_path)
+    assert calculator.calc("(A,B,C);", "(A,B,C);") == 0.25
+    assert calculator.calc("(A,B,C);", "(A,B,C);", False) == 4
+
+
+def test_drawer(phylip_path: Path, tmp_path: Path):
+    output = tmp_path / "out" / "tree.plot"
+    output.parent.mkdir()
+    PhylipDrawer(phylip_path).draw(TreeNode(0, children=[TreeNode(1, name="A"), TreeNode(2, name="B")]), output)
+    assert output.read_text() == "(A,B);FONT"
+    assert not (phylip_path / "plotfile").exists() and not (phylip_path / "intree").exists()
+
+
+def test_missing_program(tmp_path: Path):
+    with pytest.raises(AssertionError):
+        PhylipNeighborConstructor(tmp_path)
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from src.genome import GenomeMaker
+from src.phylip.scenario import run_scenarios
+
+
+@pytest.mark.parametrize("constructor", ("nj", "upgma"))
+def test_run_scenarios(constructor: str):
+    results = run_scenarios(16, 0.1, [2, 4], 128, GenomeMaker(1, 0.5), constructor=constructor)
+    assert [result.neighborhood_size for result in results] == [2, 4]
+    for result in results:
+        assert 0 <= result.false_positive <= 1 and 0 <= result.false_negative <= 1
+        assert 0 <= result.exclusive_edges <= 2 * (16 - 3)
+        assert result.tree_dist >= 0
+        assert json.loads(result.to_json())["constructed"]["edge_count"] == result.constructed_tree.branch_stats.count
@@ -1,5 +1,13 @@
+import itertools
+from concurrent import futures
+from math import isclose
+
+import numpy as np
+import pytest
+from numpy.random import default_rng
+
 from src.genome import Genome
-from src.phylip.synteny_index import calculate_synteny_distance
+from src.phylip.synteny_index import calculate_synteny_distance, calculate_synteny_index, synteny_distance_matrix
 
 
 def test_calculate_synteny_distance():
@@ -11,3 +19,74 @@ def test_calculate_synteny_distance():
         assert s == 0, s
         s = calculate_synteny_distance(g, Genome(list(reversed(g.genes))), 5)
         assert s == 0, s
+
+
+def _naive_synteny_distance(g1: Genome, g2: Genome, neighborhood_size: int) -> float:
+    all_genes = set(g1.genes) | set(g2.genes)
+    sum_ = sum(
+        calculate_synteny_index(g1, g2, gene, neighborhood_size) for gene in set(g1.genes) & set(g2.genes))
+    return 1 - ((sum_ / (2*neighborhood_size)) / len(all_genes))
+
+
+@pytest.mark.parametrize("seed", range(16))
+@pytest.mark.parametrize("neighborhood_size", (1, 3, 7))
+def test_synteny_distance_matches_naive(seed: int, neighborhood_size: int):
+    rng = default_rng(seed)
+    g1 = Genome(rng.permutation(40).tolist())
+    g2 = Genome(rng.permutation(np.arange(10, 50)).tolist())
+    expected = _naive_synteny_distance(g1, g2, neighborhood_size)
+    assert isclose(calculate_synteny_distance(g1, g2, neighborhood_size), expected)
+
+
+@pytest.mark.parametrize("processes", (1, 2))
+@pytest.mark.parametrize("neighborhood_size", (1, 4))
+def test_synteny_distance_matrix(processes: int, neighborhood_size: int):
+    rng = default_rng(neighborhood_size)
+    genomes = [Genome(rng.permutation(np.arange(1, 31)).tolist()) for _ in range(7)]
+    matrix = synteny_distance_matrix(genomes, neighborhood_size, processes=processes)
+    for row, g1 in enumerate(genomes):
+        for col, g2 in enumerate(genomes):
+            assert isclose(matrix[row, col], calculate_synteny_distance(g1, g2, neighborhood_size), abs_tol=1e-12)
+
+
+def test_synteny_distance_matrix_different_genes():
+    genomes = [Genome(list(range(15))), Genome(list(range(15, 30))), Genome(list(reversed(range(15))))]
+    matrix = synteny_distance_matrix(genomes, 5)
+    assert matrix.tolist() == [[0, 1, 0], [1, 0, 1], [0, 1, 0]]
+
+
+def test_multiple_neighborhood_sizes():
+    rng = default_rng(3)
+    sizes = [1, 2, 4, 7]
+    genomes = [Genome(rng.permutation(np.arange(1, 31)).tolist()) for _ in range(5)]
+    partial = Genome(rng.permutation(np.arange(10, 40)).tolist())
+    distances = calculate_synteny_distance(genomes[0], partial, sizes)
+    assert distances == [calculate_synteny_distance(genomes[0], partial, size) for size in sizes]
+    for size, matrix in zip(sizes, synteny_distance_matrix(genomes, sizes)):
+        assert np.allclose(matrix, synteny_distance_matrix(genomes, size))
+        for row, col in itertools.combinations(range(len(genomes)), 2):
+            assert isclose(
+                matrix[row, col], _naive_synteny_distance(genomes[row], genomes[col], size), abs_tol=1e-12)
+
+
+def test_numpy_neighborhood_sizes():
+    rng = default_rng(5)
+    genomes = [Genome(rng.permutation(np.arange(1, 31)).tolist()) for _ in range(4)]
+    sizes = np.array([2, 5])
+    assert calculate_synteny_distance(genomes[0], genomes[1], sizes[1]) == \
+        calculate_synteny_distance(genomes[0], genomes[1], 5)
+    assert calculate_synteny_distance(genomes[0], genomes[1], sizes) == \
+        calculate_synteny_distance(genomes[0], genomes[1], [2, 5])
+    assert np.array_equal(synteny_distance_matrix(genomes, sizes[1]), synteny_distance_matrix(genomes, 5))
+    for matrix, size in zip(synteny_distance_matrix(genomes, sizes), (2, 5)):
+        assert np.array_equal(matrix, synteny_distance_matrix(genomes, size))
+
+
+def test_concurrent_synteny_distance_matrices():
+    rng = default_rng(11)
+    genome_sets = [[Genome(rng.permutation(np.arange(1, 41)).tolist()) for _ in range(6)] for _ in range(8)]
+    expected = [synteny_distance_matrix(genomes, 3) for genomes in genome_sets]
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        matrices = list(executor.map(lambda genomes: synteny_distance_matrix(genomes, 3), genome_sets * 4))
+    for matrix, expected_matrix in zip(matrices, expected * 4):
+        assert np.array_equal(matrix, expected_matrix)
@@ -0,0 +1,80 @@
+from concurrent import futures
+
+import numpy as np
+import pytest
+
+from src.phylip.newick import NewickParser
+from src.phylip.tree_dist import tree_distance, tree_distance_matrix, TreeDistCalculator, tree_splits, \
+    internal_split_count
+from src.tree import YuleTreeGenerator, FlatTree
+
+
+@pytest.mark.parametrize("first, second, symmetric_difference, branch_score, common", [
+    ("((A:1,B:1):1,(C:1,D:1):1);", "(A:1,B:1,(C:1,D:1):2);", 0, 0, 1),
+    ("((A:1,B:1):1,(C:1,D:1):1);", "((A:1,C:1):1,(B:1,D:1):1);", 2, 8, 0),
+    ("(A:1,B:2,(C:1,D:1):1);", "(A:1,B:1,(C:1,D:1):3);", 0, 5, 1),
+    ("(A:1,B:1,(C:1,(D:1,E:1):1):1);", "(A:1,B:1,C:1,D:1,E:1);", 2, 2, 0),
+])
+def test_tree_distance(first: str, second: str, symmetric_difference: int, branch_score: float, common: int):
+    distance = tree_distance(first, second)
+    assert distance.symmetric_difference == symmetric_difference
+    assert distance.branch_score == pytest.approx(branch_score)
+    assert distance.common_edges == common
+    calculator = TreeDistCalculator()
+    assert calculator.calc(first, second) == pytest.approx(branch_score)
+    assert calculator.calc(first, second, False) == symmetric_difference
+
+
+def test_tree_inputs():
+    tree = YuleTreeGenerator(size=32, scale=0.5, seed=43).construct()
+    newick = tree.root.to_newick()
+    splits = [tree_splits(tree.root), tree_splits(newick), tree_splits(FlatTree.from_newick(newick))]
+    assert splits[0] == splits[1] == splits[2]
+    assert len(splits[0].internal) == 32 - 3
+    parsed = NewickParser(newick).parse().root
+    assert tree_distance(parsed, tree.root) == (0, 0, 29, 29, 29)
+    with pytest.raises(ValueError):
+        tree_distance(newick, YuleTreeGenerator(size=31, scale=0.5, seed=43).construct().root)
+
+
+@pytest.mark.parametrize("newick", [
+    "((A:1,B:1):1,(C:1,D:1):1);",
+    "((A:1,B:1):1,C:1);",
+    "(A:1,B:1,(C:1,(D:1,E:1):1):1);",
+    "(A:1,B:1,C:1,D:1,E:1);",
+    "(((A:1,B:1):1):1,(C:1,D:1):1);",
+    "(((A:1,B:1):1,C:1,D:1):1);",
+    "(A:1,((B:1,C:1):1,(D:1,E:1,F:1):1):1);",
+    "(((A:1,B:1):1,(C:1,D:1):1):1);",
+    "((A:1):1,B:1,C:1);",
+])
+def test_internal_split_count(newick: str):
+    assert internal_split_count(newick) == len(tree_splits(newick).internal)
+
+
+def test_internal_split_count_of_yule_tree():
+    tree = YuleTreeGenerator(size=64, scale=0.5, seed=47).construct(True)
+    assert internal_split_count(tree.root) == len(tree_splits(tree.root).internal) == 64 - 3
+
+
+@pytest.mark.parametrize("processes", (1, 2))
+def test_tree_distance_matrix(processes: int):
+    trees = [YuleTreeGenerator(size=16, scale=0.5, seed=seed).construct().root.to_newick() for seed in range(6)]
+    symmetric_differences, branch_scores = tree_distance_matrix(trees, processes=processes)
+    for row, first in enumerate(trees):
+        for col, second in enumerate(trees):
+            distance = tree_distance(first, second)
+            assert symmetric_differences[row, col] == distance.symmetric_difference
+            assert branch_scores[row, col] == pytest.approx(distance.branch_score)
+    assert (np.diag(symmetric_differences) == 0).all()
+
+
+def test_concurrent_tree_distance_matrices():
+    trees = [YuleTreeGenerator(size=32, scale=0.5, seed=seed).construct().root.to_newick() for seed in range(60)]
+    tree_sets = [trees[first:first + 20] for first in range(0, 60, 20)]
+    expected = [tree_distance_matrix(trees) for trees in tree_sets]
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        matrices = list(executor.map(tree_distance_matrix, tree_sets * 4))
+    for (symmetric_differences, branch_scores), (expected_differences, expected_scores) in zip(matrices, expected * 4):
+        assert np.array_equal(symmetric_differences, expected_differences)
+        assert np.array_equal(branch_scores, expected_scores)
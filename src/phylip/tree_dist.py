@@ -0,0 +1,134 @@
+from concurrent import futures
+from typing import NamedTuple, Dict, List, Optional, Tuple, Union, FrozenSet
+
+import numpy as np
+
+from src.tree import FlatTree, TreeNode
+
+Tree = Union[str, TreeNode, FlatTree]
+
+
+class Splits(NamedTuple):
+    # The bipartitions of the leaves made by the edges of a tree, taken as unrooted. A split is keyed by the packed
+    # bitmask of the side without the first leaf (by name) and holds the total length of the edges making it (the two
+    # edges of a root with two children make the same split).
+    leaf_names: Tuple[str, ...]
+    lengths: Dict[bytes, float]
+    internal: FrozenSet[bytes]  # The splits which don't cut off a single leaf
+
+
+class TreeDistance(NamedTuple):
+    symmetric_difference: int  # Internal splits found in only one of the trees
+    branch_score: float  # Sum of squared differences of the split lengths (0 for a missing split), as treedist
+    common_edges: int  # Internal splits found in both trees
+    first_edges: int
+    second_edges: int
+
+
+def _as_flat_tree(tree: Tree) -> FlatTree:
+    if isinstance(tree, FlatTree):
+        return tree
+    if isinstance(tree, TreeNode):
+        return FlatTree.from_tree_node(tree)
+    return FlatTree.from_newick(tree, synthetic_names=True)
+
+
+def tree_splits(tree: Tree) -> Splits:
+    flat = _as_flat_tree(tree)
+    leaves = flat.leaves
+    names = [flat.names[leaf] for leaf in leaves.tolist()]
+    if len(set(names)) != len(names):
+        raise ValueError("Leaf names must be unique")
+    by_name = np.argsort(names, kind="stable")
+    edges = np.arange(1, len(flat.parents))
+    masks = flat.clade_masks(edges)[:, by_name]
+    masks[masks[:, 0]] ^= True
+    sides = masks.sum(axis=1)
+    keep = sides > 0
+    keys = [bytes(row) for row in np.packbits(masks[keep], axis=1)]
+    lengths: Dict[bytes, float] = {}
+    for key, length in zip(keys, np.nan_to_num(flat.edge_lens[edges][keep]).tolist()):
+        lengths[key] = lengths.get(key, 0.0) + length
+    internal = frozenset(
+        key for key, side in zip(keys, sides[keep].tolist()) if 1 < side < len(names) - 1)
+    return Splits(tuple(sorted(names)), lengths, internal)
+
+
+def internal_split_count(tree: Tree) -> int:
+    # len(tree_splits(tree).internal) in linear time, without the leaf masks: the edges with more than one leaf on
+    # either side, less one for every node of degree two (unary, or a root with two children), which joins its two
+    # edges into a single split
+    flat = _as_flat_tree(tree)
+    nodes = np.arange(len(flat.parents))
+    leaf_ends = np.r_[0, np.cumsum(flat.subtree_sizes == 1)]
+    leaf_counts = leaf_ends[nodes + flat.subtree_sizes] - leaf_ends[nodes]
+    is_internal = (leaf_counts > 1) & (leaf_counts < leaf_ends[-1] - 1)
+    child_counts = np.diff(flat.child_offsets)
+    joined = int(np.count_nonzero(is_internal[1:] & (child_counts[1:] == 1)))
+    root = 0  # Edges above a chain of unary nodes from the root cut off no leaf, the root is where the chain ends
+    while child_counts[root] == 1:
+        root = flat.children[flat.child_offsets[root]]
+    if child_counts[root] == 2:
+        joined += int(is_internal[flat.children[flat.child_offsets[root]]])
+    return int(np.count_nonzero(is_internal[1:])) - joined
+
+
+def splits_distance(first: Splits, second: Splits) -> TreeDistance:
+    if first.leaf_names != second.leaf_names:
+        raise ValueError("Trees must have the same leaves")
+    common = len(first.internal & second.internal)
+    branch_score = sum(
+        (first.lengths.get(key, 0.0) - second.lengths.get(key, 0.0)) ** 2
+        for key in first.lengths.keys() | second.lengths.keys())
+    return TreeDistance(
+        len(first.internal) + len(second.internal) - 2 * common, branch_score, common, len(first.internal),
+        len(second.internal))
+
+
+def tree_distance(first: Tree, second: Tree) -> TreeDistance:
+    return splits_distance(tree_splits(first), tree_splits(second))
+
+
+class TreeDistCalculator:
+    # Same interface as PhylipTreeDistCalculator, in process
+    def calc(self, tree1: Tree, tree2: Tree, use_edge_length: bool = True) -> float:
+        distance = tree_distance(tree1, tree2)
+        return distance.branch_score if use_edge_length else distance.symmetric_difference
+
+
+_splits: Optional[List[Splits]] = None
+
+
+def _init_worker(splits: List[Splits]):
+    # Pool workers get the splits once, instead of with every row
+    global _splits
+    _splits = splits
+
+
+def _distances_row(row: int, splits: Optional[List[Splits]] = None) -> List[TreeDistance]:
+    # The splits are those of the pool worker when not given
+    if splits is None:
+        splits = _splits
+    return [splits_distance(splits[row], splits[col]) for col in range(row + 1, len(splits))]
+
+
+def tree_distance_matrix(trees: List[Tree], processes: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    # The symmetric difference and branch score between every pair of trees, every tree is split once
+    count = len(trees)
+    symmetric_differences = np.zeros((count, count), dtype=int)
+    branch_scores = np.zeros((count, count))
+    rows = range(count - 1)
+    if processes == 1:
+        splits = [tree_splits(tree) for tree in trees]
+        distances = [_distances_row(row, splits) for row in rows]
+    else:
+        with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            splits = list(executor.map(tree_splits, trees, chunksize=max(1, count // (4 * processes))))
+        with futures.ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker, initargs=(splits,)) as executor:
+            distances = list(executor.map(_distances_row, rows))
+    for row, row_distances in zip(rows, distances):
+        for col, distance in enumerate(row_distances, start=row + 1):
+            symmetric_differences[row, col] = symmetric_differences[col, row] = distance.symmetric_difference
+            branch_scores[row, col] = branch_scores[col, row] = distance.branch_score
+    return symmetric_differences, branch_scores
@@ -1,8 +1,20 @@
 import json
+from concurrent import futures
 from pathlib import Path
-from typing import NamedTuple
+from typing import NamedTuple, Optional, Tuple, List
+
+from src.simulator.writer import DEFAULT_COMPRESSION_LEVEL
+from src.tree import FILL_MODES, TREE_GENERATORS, ULTRAMETRIC_MODES, ULTRAMETRIC_HANG
 
 MAX_PROCESSES = 20
+DEFAULT_FILL_MODE = "recursive"
+DEFAULT_TREE_GENERATOR = "list"
+# Trees run in threads by default, processes sidestep the GIL for the pure Python genome and suffix tree work
+EXECUTORS = {
+    "threads": futures.ThreadPoolExecutor,
+    "processes": futures.ProcessPoolExecutor,
+}
+DEFAULT_EXECUTOR = "threads"
 
 
 class Scale(NamedTuple):
@@ -15,6 +27,24 @@ class Scale(NamedTuple):
         assert self.step < 1 and round(self.begin + self.step, ndigits=2) <= self.end
 
 
+class Adaptive(NamedTuple):
+    # Runs trees in batches until the confidence interval of the mean occurrences of every island size in the range
+    # is within the tolerance of the mean (relative), and at least min_trees but at most max_trees
+    tolerance: float
+    min_trees: int
+    max_trees: int
+    island_sizes: Tuple[int, int]  # First and last (inclusive)
+    batch_size: int = 10
+    confidence: float = 0.95
+
+    def validate(self, genome_size: int):
+        assert self.tolerance > 0
+        assert 2 <= self.min_trees <= self.max_trees
+        assert 1 <= self.island_sizes[0] <= self.island_sizes[1] <= genome_size
+        assert self.batch_size > 0
+        assert 0 < self.confidence < 1
+
+
 class Configuration(NamedTuple):
     data_path: Path
     tree_count: int
@@ -24,18 +54,77 @@ class Configuration(NamedTuple):
     processes: int
     ultrametric: bool
     scale: Scale
+    fill_mode: str = DEFAULT_FILL_MODE
+    seed: Optional[int] = None
+    subtree_processes: int = 1
+    tree_generator: str = DEFAULT_TREE_GENERATOR
+    ultrametric_mode: str = ULTRAMETRIC_HANG
+    tree_library: Optional[Path] = None
+    executor: str = DEFAULT_EXECUTOR
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL
+    compression_threads: int = 1
+    counting_processes: int = 0  # Runs the trees as a pipeline of simulating and counting processes when set
+    adaptive: Optional[Adaptive] = None  # Replaces the fixed tree_count when set
+    # Optional grid of a campaign, every combination of these (or the single values above) is run for every scale
+    leaf_counts: Tuple[int, ...] = ()
+    genome_sizes: Tuple[int, ...] = ()
+    alphas: Tuple[float, ...] = ()
 
     def validate(self):
         assert self.tree_count > 0
-        assert 0 < self.alpha <= 1
-        assert self.genome_size > 0
+        for alpha in self.alphas or (self.alpha,):
+            assert 0 < alpha <= 1
+        for genome_size in self.genome_sizes or (self.genome_size,):
+            assert genome_size > 0
+        for leaf_count in self.leaf_counts or (self.leaf_count,):
+            assert leaf_count > 0
         assert self.data_path.is_dir()
         assert 0 < self.processes <= MAX_PROCESSES
+        assert self.fill_mode in FILL_MODES, f"Unknown fill mode: [{self.fill_mode}]"
+        assert self.seed is None or self.seed >= 0
+        assert self.subtree_processes > 0
+        assert self.subtree_processes == 1 or self.fill_mode == "subtrees", "Only subtrees fill mode runs in parallel"
+        assert self.tree_generator in TREE_GENERATORS, f"Unknown tree generator: [{self.tree_generator}]"
+        assert self.ultrametric_mode in ULTRAMETRIC_MODES, f"Unknown ultrametric mode: [{self.ultrametric_mode}]"
+        assert self.executor in EXECUTORS, f"Unknown executor: [{self.executor}]"
+        assert 0 <= self.compression_level <= 9
+        assert self.compression_threads > 0
+        assert 0 <= self.counting_processes <= MAX_PROCESSES
+        assert not self.counting_processes or self.executor == "processes", "The pipeline only runs in processes"
+        if self.adaptive is not None:
+            for genome_size in self.genome_sizes or (self.genome_size,):
+                self.adaptive.validate(genome_size)
         self.scale.validate()
 
     def file_pattern(self, scale: float) -> str:
         return f"scale_{scale}_leaves_{self.leaf_count}_genome_{self.genome_size}_alpha_{self.alpha}.json"
 
+    @property
+    def max_tree_count(self) -> int:
+        return self.tree_count if self.adaptive is None else self.adaptive.max_trees
+
+    def scales(self) -> List[float]:
+        scales = []
+        current_scale = self.scale.begin
+        while current_scale <= self.scale.end:
+            scales.append(current_scale)
+            current_scale = round(current_scale + self.scale.step, ndigits=2)
+        return scales
+
+    def campaign(self, scales: Optional[List[float]] = None) -> List[Tuple['Configuration', float]]:
+        # Every point of the grid as a configuration of single values, with each of the scales (all by default)
+        return [
+            (self._replace(
+                leaf_count=leaf_count, genome_size=genome_size, alpha=alpha, leaf_counts=(), genome_sizes=(),
+                alphas=()), scale)
+            for leaf_count in self.leaf_counts or (self.leaf_count,)
+            for genome_size in self.genome_sizes or (self.genome_size,)
+            for alpha in self.alphas or (self.alpha,)
+            for scale in (self.scales() if scales is None else scales)]
+
+    def summary_path(self, scale: float) -> Path:
+        return self.data_path / str(scale) / f"summary_{self.file_pattern(scale)}"
+
 
 def parse_configuration(config_path: Path) -> Configuration:
     assert config_path.is_file(), f"Configuration file not found at: [{config_path}]"
@@ -47,16 +136,44 @@ def parse_configuration(config_path: Path) -> Configuration:
             raise KeyError(f"Invalid configuration! Missing key: [{key}]")
         return configuration[key]
 
+    def get_grid_vals(key: str, type_) -> Tuple:
+        # A grid key may hold a list of values to run instead of a single one
+        value = get_conf_val(key)
+        return tuple(map(type_, value)) if isinstance(value, list) else (type_(value),)
+
     tree_count = int(get_conf_val("tree_count"))
     data_path = get_conf_val("data_path")
-    alpha = float(get_conf_val("alpha"))
-    genome_size = int(get_conf_val("genome_size"))
-    leaf_count = int(get_conf_val("leaf_count"))
+    alphas = get_grid_vals("alpha", float)
+    genome_sizes = get_grid_vals("genome_size", int)
+    leaf_counts = get_grid_vals("leaf_count", int)
     processes = int(get_conf_val("processes"))
     ultrametric = bool(get_conf_val("ultrametric"))
     scale = Scale(*map(lambda x: round(x, 2), get_conf_val("scale")))
+    fill_mode = configuration.get("fill_mode", DEFAULT_FILL_MODE)
+    seed = configuration.get("seed")  # When missing, the seed saved in the data path or a new one
+    seed = int(seed) if seed is not None else None
+    subtree_processes = int(configuration.get("subtree_processes", 1))
+    tree_generator = configuration.get("tree_generator", DEFAULT_TREE_GENERATOR)
+    ultrametric_mode = configuration.get("ultrametric_mode", ULTRAMETRIC_HANG)
+    tree_library = configuration.get("tree_library")
+    executor = configuration.get("executor", DEFAULT_EXECUTOR)
+    compression_level = int(configuration.get("compression_level", DEFAULT_COMPRESSION_LEVEL))
+    compression_threads = int(configuration.get("compression_threads", 1))
+    counting_processes = int(configuration.get("counting_processes", 0))
+    adaptive = configuration.get("adaptive")
+    if adaptive is not None:
+        adaptive = Adaptive(
+            tolerance=float(adaptive["tolerance"]), min_trees=int(adaptive["min_trees"]),
+            max_trees=int(adaptive["max_trees"]), island_sizes=tuple(map(int, adaptive["island_sizes"])),
+            batch_size=int(adaptive.get("batch_size", 10)), confidence=float(adaptive.get("confidence", 0.95)))
     return Configuration(
-        data_path=Path(data_path).expanduser(), tree_count=tree_count, alpha=alpha,
-        genome_size=genome_size, leaf_count=leaf_count, processes=processes, scale=scale,
-        ultrametric=ultrametric
+        data_path=Path(data_path).expanduser(), tree_count=tree_count, alpha=alphas[0],
+        genome_size=genome_sizes[0], leaf_count=leaf_counts[0], processes=processes, scale=scale,
+        ultrametric=ultrametric, fill_mode=fill_mode, seed=seed, subtree_processes=subtree_processes,
+        tree_generator=tree_generator, ultrametric_mode=ultrametric_mode,
+        tree_library=Path(tree_library).expanduser() if tree_library is not None else None, executor=executor,
+        compression_level=compression_level, compression_threads=compression_threads,
+        counting_processes=counting_processes, adaptive=adaptive,
+        leaf_counts=leaf_counts if len(leaf_counts) > 1 else (),
+        genome_sizes=genome_sizes if len(genome_sizes) > 1 else (), alphas=alphas if len(alphas) > 1 else ()
     )
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import NamedTuple, Dict, Tuple, Optional
+
+from numpy.random import SeedSequence
+
+from src.simulator.writer import write_atomically
+
+MANIFEST_NAME = "manifest.jsonl"
+CAMPAIGN_NAME = "campaign.json"
+
+# A tree of a campaign: leaf count, genome size, alpha, scale, index and seed
+JobKey = Tuple[int, int, float, float, int, int]
+
+
+class ManifestEntry(NamedTuple):
+    leaf_count: int
+    genome_size: int
+    alpha: float
+    scale: float
+    idx: int
+    seed: int
+    output: str  # Relative to the data path
+
+    @property
+    def key(self) -> JobKey:
+        return self.leaf_count, self.genome_size, self.alpha, self.scale, self.idx, self.seed
+
+
+class Manifest:
+    # Append only record of the completed trees of the campaigns writing to a data path, one JSON object per line. A
+    # line is only appended once its tree file is written, so a rerun of a killed campaign can skip every tree found
+    # here. A partial last line (the campaign was killed while appending it) is ignored.
+    def __init__(self, data_path: Path):
+        self.data_path = data_path
+        self.path = data_path / MANIFEST_NAME
+        self.campaign_path = data_path / CAMPAIGN_NAME
+
+    def campaign_seed(self, seed: Optional[int] = None) -> int:
+        # The seed of the campaign writing to the data path, saved by its first run. The trees (and the keys of the
+        # manifest) derive from it, so a rerun whose configuration has no seed takes the saved one, and a rerun with
+        # another seed would run every tree again next to the recorded ones.
+        if self.campaign_path.is_file():
+            saved = int(json.loads(self.campaign_path.read_text())["seed"])
+            if seed is not None and seed != saved:
+                raise ValueError(
+                    f"Seed: {seed} differs from the seed: {saved} of the campaign at: {self.data_path}, "
+                    f"remove the seed from the configuration or use a new data path")
+            return saved
+        if seed is None:
+            seed = int(SeedSequence().entropy)
+        write_atomically(self.campaign_path, json.dumps({"seed": seed}).encode())
+        return seed
+
+    def read(self) -> Dict[JobKey, ManifestEntry]:
+        entries = {}
+        if not self.path.is_file():
+            return entries
+        line = ""
+        with self.path.open("r") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    entry = ManifestEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    logging.warning("Ignoring invalid line %s of manifest: %s", line_number, self.path)
+                    continue
+                entries[entry.key] = entry
+        if line and not line.endswith("\n"):
+            with self.path.open("a") as f:  # Keeps the next entry off the partial line
+                f.write("\n")
+        return entries
+
+    def append(self, entry: ManifestEntry):
+        with self.path.open("a") as f:
+            f.write(json.dumps(entry._asdict()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
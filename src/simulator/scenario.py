@@ -3,52 +3,34 @@ import json
 import logging
 import statistics
 import struct
-import time
-import uuid
+from functools import partial
+from itertools import islice
+from collections import deque
 from concurrent import futures
 from pathlib import Path
 
-import numpy.random
+import numpy as np
+from numpy.random import SeedSequence
 from math import isclose
-from typing import NamedTuple
+from typing import NamedTuple, Optional, List, Set, Tuple, Dict, Callable
 
 from src.genome import GenomeMaker
-from src.occurrences import Occurrences, Mean_occs, Tot_mean_occs, serialize_occurrences, deserialize_occurrences
-from src.simulator.configuration import Configuration, MAX_PROCESSES
+from src.occurrences import Occurrences, Mean_occs, serialize_occurrences, deserialize_occurrences
+from src.phylip.tree_dist import internal_split_count
+from src.simulator.configuration import Adaptive, Configuration, MAX_PROCESSES, EXECUTORS, DEFAULT_FILL_MODE, \
+    DEFAULT_TREE_GENERATOR
+from src.simulator.manifest import Manifest, ManifestEntry, JobKey
+from src.simulator.shared_genomes import SharedGenomes
+from src.simulator.summary import OccurrenceStats, ScaleSummary
+from src.simulator.writer import ResultWriter
 from src.suffix_trees.STree import STree
 from src.time_func import time_func
-from src.tree import YuleTreeGenerator, fill_genome, TreeDesc
-
-total_results = {}
-def init_tot_res(genome_size: int):
-    for i in range(1, int(genome_size) + 2):
-        total_results[i] = 0.0
-
-def upd_tot_res(result):
-    total_results[int(result.genome_size) + 1] += 1	#holds tree_count
-    for i in range(1, int(result.genome_size) + 1):
-        try:
-            #print('upd_tot_res, total_results[i] = ', type(total_results), type(result.comulative_mean_occs), type(result.mean_occurrences))
-            total_results[i] += result.mean_occurrences[i]
-            result.comulative_mean_occs[i] = total_results[i]
-        except KeyError:
-            pass
-
-def upd_tot_last(result):
-    tc = float(total_results[int(result.genome_size) + 1] + 1)
-    total_results[int(result.genome_size) + 1] = None
-    for i in range(1, int(result.genome_size) + 1):
-        try:
-            total_results[i] += result.mean_occurrences[i]
-            #print('upd_tot_last', i, total_results[i], result.mean_occurrences[i], tc)
-        except KeyError:
-            print('upd_tot_last pass', i)
-            pass
-        total_results[i] /= tc
-        total_results[i] = '{:05.3f}'.format(total_results[i])
-        result.comulative_mean_occs[i] = total_results[i]
-
+from src.tree import TreeDesc, FILL_MODES, TREE_GENERATORS, ULTRAMETRIC_HANG
+from src.tree_library import TreeLibrary
 
+# Version 2 names the leaves with the bijective NameGenerator, files without a version use the legacy names. Version 3
+# counts the internal edges of the model as its internal splits, earlier versions as its internal nodes but the root.
+RESULT_FORMAT_VERSION = 3
 
 
 class Result(NamedTuple):
@@ -62,11 +44,10 @@ class Result(NamedTuple):
     seed: int
     occurrences: Occurrences
     mean_occurrences: Mean_occs
-    comulative_mean_occs: Tot_mean_occs
 
-    def to_json(self) -> str:
-        print('to_json')
+    def to_json(self, indent: Optional[int] = 4) -> str:
         data = {
+            "format_version": RESULT_FORMAT_VERSION,
             "model": self.model_tree.to_json(),
             "genome_size": self.genome_size,
             "total_jumps": self.total_jumps,
@@ -77,10 +58,9 @@ class Result(NamedTuple):
             "occurrences": json.dumps(self.occurrences),
 #            "mean_occurrences": json.dumps('{:5.3f}'.format(self.mean_occurrences)),
             "mean_occurrences": json.dumps(self.mean_occurrences),
-            "comulative_mean_occs": json.dumps(total_results),
             "alpha": self.alpha
         }
-        return json.dumps(data, indent=4)
+        return json.dumps(data, indent=indent)
 
     def serialize(self) -> bytes:
         format_ = "ifiif"
@@ -95,7 +75,7 @@ class Result(NamedTuple):
         genome_size, expected_edge_len, leaves_count, total_jumps, avg_jumps = struct.unpack(format_, data[parsed:total_parsed])
         occurrences = deserialize_occurrences(data[total_parsed:])
         print('simulator\scenario\deserialize return Result')
-        return Result(model_tree, genome_size, expected_edge_len, leaves_count, total_jumps, avg_jumps, occurrences, mean_occurrences, comulative_mean_occs)
+        return Result(model_tree, genome_size, expected_edge_len, leaves_count, total_jumps, avg_jumps, occurrences, mean_occurrences)
 
     def __eq__(self, other: 'Result') -> bool:
         if self.genome_size != other.genome_size or not isclose(
@@ -113,86 +93,425 @@ class Result(NamedTuple):
         return True
 
 
-def run_scenario(size: int, scale: float, idx: int, genome_size: int, alpha: float, ultrametric: bool) -> Result:
-    with time_func("Seeding numpy random"):
-        random_seed = int(time.time())
-        random_seed = random_seed + int(100 * scale) + idx 
-        print('run_scenario, seed = ', random_seed, idx)
-        numpy.random.seed(random_seed)
-        genome_maker = GenomeMaker(random_seed, alpha)
+def make_job_seed(entropy: int, scale: float, idx: int) -> int:
+    # Jobs of the same campaign get independent seeds which only depend on the campaign entropy, the scale and the
+    # index of the tree, so they never collide and a campaign can be reproduced from its entropy.
+    state = SeedSequence(entropy, spawn_key=(round(100 * scale), idx)).generate_state(1, np.uint64)
+    return int(state[0])
+
+
+class SimulatedTree(NamedTuple):
+    # A tree whose genomes were evolved, before counting the occurrences in its leaves
+    model_tree: TreeDesc
+    total_jumps: int
+    avg_jumps: float
+
+
+def simulate_tree(
+        size: int, scale: float, idx: int, genome_size: int, alpha: float, ultrametric: bool, seed: int,
+        fill_mode: str = DEFAULT_FILL_MODE, subtree_processes: int = 1, tree_generator: str = DEFAULT_TREE_GENERATOR,
+        ultrametric_mode: str = ULTRAMETRIC_HANG,
+        tree_library: Optional[TreeLibrary] = None) -> Tuple[SimulatedTree, List[List[int]]]:
+    logging.info("Running tree: %s with seed: %s", idx, seed)
+    genome_maker = GenomeMaker(seed, alpha)
 
-    with time_func("Constructing the Yule tree"):
-        res = YuleTreeGenerator(size=size, scale=scale, seed=random_seed).construct(ultrametric)
+    if tree_library is not None:
+        with time_func("Getting the Yule tree from the library"):
+            res = tree_library.get(size, scale, ultrametric, seed, tree_generator, ultrametric_mode)
+    else:
+        with time_func("Constructing the Yule tree"):
+            res = TREE_GENERATORS[tree_generator](size=size, scale=scale, seed=seed).construct(
+                ultrametric, ultrametric_mode)
     with time_func("Get branch statistics"):
         branch_stats = res.root.branch_len_stats()
     logging.info(
         "Branch count: %s avg: %s median: %s expected: %s", branch_stats.count,
         branch_stats.average, branch_stats.median, scale)
     total_jumped = []
-    with time_func(f"Filling genome, size: {genome_size}"):
-        fill_genome(res.root, genome_size=genome_size, maker=genome_maker, total_jumped=total_jumped)
+    fill = FILL_MODES[fill_mode]
+    if subtree_processes > 1:
+        fill = partial(fill, processes=subtree_processes)
+    with time_func(f"Filling genome, size: {genome_size} mode: {fill_mode}"):
+        fill(res.root, genome_size=genome_size, maker=genome_maker, total_jumped=total_jumped)
 
     assert len(res.leaves) == size
 
-    mean_occurrences = {}
-    comulative_mean_occs = {}
     newick = res.root.to_newick()
-    internal_branches_orig = len([c for c in newick if c == ')']) - 1
-    model_tree = TreeDesc(newick, internal_branches_orig, branch_stats)
-    concat_genomes = [leaf.genome.genes for leaf in res.leaves]
-    suffix_tree = STree(concat_genomes)
-    print('run_scenario concat_genomes = ', concat_genomes)
-    print('run_scenario suffix_tree = ', suffix_tree)
+    # Counted as the internal splits, as the internal branches of the reconstructed trees (see RESULT_FORMAT_VERSION)
+    model_tree = TreeDesc(newick, internal_split_count(res.root), branch_stats)
+    simulated = SimulatedTree(
+        model_tree, sum(total_jumped), statistics.mean(total_jumped) if total_jumped else 0)
+    return simulated, [leaf.genome.genes for leaf in res.leaves]
+
+
+def count_occurrences(genomes: List[List[int]], genome_size: int) -> Tuple[Occurrences, Mean_occs]:
+    mean_occurrences = {}
+    suffix_tree = STree(genomes)
     with time_func("Counting occurrences"):
         occurrences = suffix_tree.occurrences()
         for i in range(1, genome_size + 1):
             mean_occurrences[i] = sum(occurrences[i])/len(occurrences[i])
-            comulative_mean_occs[i] = total_results[i]
+    return occurrences, mean_occurrences
+
+
+def run_scenario(
+        size: int, scale: float, idx: int, genome_size: int, alpha: float, ultrametric: bool, seed: int,
+        fill_mode: str = DEFAULT_FILL_MODE, subtree_processes: int = 1, tree_generator: str = DEFAULT_TREE_GENERATOR,
+        ultrametric_mode: str = ULTRAMETRIC_HANG, tree_library: Optional[TreeLibrary] = None) -> Result:
+    simulated, genomes = simulate_tree(
+        size, scale, idx, genome_size, alpha, ultrametric, seed, fill_mode, subtree_processes, tree_generator,
+        ultrametric_mode, tree_library)
+    occurrences, mean_occurrences = count_occurrences(genomes, genome_size)
     return Result(
-        model_tree, genome_size, scale, size, sum(total_jumped), statistics.mean(total_jumped) if total_jumped else 0,
-        alpha, random_seed, occurrences, mean_occurrences, comulative_mean_occs
+        simulated.model_tree, genome_size, scale, size, simulated.total_jumps, simulated.avg_jumps, alpha, seed,
+        occurrences, mean_occurrences
     )
 
 
-def run_single_job(
-        pattern: str, leaf_count: int, scale: float, base_path: Path, alpha: float, genome_size: int, idx: int,
-        tree_count: int, ultrametric: bool):
-    print('run_single_job, pattern = ', pattern)
-    assert pattern
-    with time_func(f"Running tree: {idx} of scenario with {leaf_count} leaves, alpha: {alpha} and scale: {scale}"):
-        result = run_scenario(leaf_count, scale, idx, genome_size=genome_size, alpha=alpha, ultrametric=ultrametric)
-    if (idx == tree_count - 1):
-        upd_tot_last(result)
-    else:
-        upd_tot_res(result)
-    print('run_single_job, result = ', result)
-    #print(total_results)
-    outdir = base_path / str(scale)
-    outdir.mkdir(exist_ok=True)
-    if (idx == tree_count - 1):
-        pattern = 'last_' + pattern
-    print('run_single_job, pattern = ', pattern)
-    output = outdir / f"{uuid.uuid4()}_{pattern}"
-    with gzip.open(str(output.with_suffix(".json.gz")), "w") as f_gz:
-        f_gz.write(result.to_json().encode())
+# The trees of a leaf count, genome size, alpha and scale
+ScenarioKey = Tuple[int, int, float, float]
 
 
-def run_scenarios(configuration: Configuration, scale: float):
+class JobSpec(NamedTuple):
+    # Everything a worker needs to run a single tree, picklable so jobs can be sent to a process pool
+    pattern: str
+    leaf_count: int
+    scale: float
+    base_path: Path
+    alpha: float
+    genome_size: int
+    idx: int
+    ultrametric: bool
+    seed: int
+    fill_mode: str
+    subtree_processes: int
+    tree_generator: str
+    ultrametric_mode: str
+    tree_library: Optional[Path]
+
+    @property
+    def key(self) -> JobKey:
+        return self.leaf_count, self.genome_size, self.alpha, self.scale, self.idx, self.seed
+
+    @property
+    def scenario(self) -> ScenarioKey:
+        return self.leaf_count, self.genome_size, self.alpha, self.scale
+
+
+class TreeSummary(NamedTuple):
+    # What a worker sends back: the mean occurrences per island size of its tree (index 0 unused) and the result
+    # to write
+    idx: int
+    seed: int
+    mean_occurrences: np.ndarray
+    result: Result
+
+
+def make_job_spec(configuration: Configuration, scale: float, idx: int) -> JobSpec:
+    return JobSpec(
+        configuration.file_pattern(scale), configuration.leaf_count, scale, configuration.data_path,
+        configuration.alpha, configuration.genome_size, idx, configuration.ultrametric,
+        make_job_seed(configuration.seed, scale, idx), configuration.fill_mode, configuration.subtree_processes,
+        configuration.tree_generator, configuration.ultrametric_mode, configuration.tree_library)
+
+
+def make_job_specs(configuration: Configuration, scale: float, count: Optional[int] = None) -> List[JobSpec]:
+    return [
+        make_job_spec(configuration, scale, idx)
+        for idx in range(configuration.tree_count if count is None else count)]
+
+
+def result_path(spec: JobSpec) -> Path:
+    # Named by the job, so a tree run again after a kill overwrites the file left by its first run
+    return (spec.base_path / str(spec.scale) / f"{spec.idx}_{spec.seed}_{spec.pattern}").with_suffix(".json.gz")
+
+
+def read_mean_occurrences(path: Path, genome_size: int) -> np.ndarray:
+    with gzip.open(str(path), "r") as f:
+        data = json.loads(f.read().decode())
+    mean_occurrences = np.full(genome_size + 1, np.nan)
+    for i, mean in json.loads(data["mean_occurrences"]).items():
+        mean_occurrences[int(i)] = mean
+    return mean_occurrences
+
+
+def _tree_summary(spec: JobSpec, result: Result) -> TreeSummary:
+    mean_occurrences = np.full(spec.genome_size + 1, np.nan)
+    for i, mean in result.mean_occurrences.items():
+        mean_occurrences[i] = mean
+    return TreeSummary(spec.idx, spec.seed, mean_occurrences, result)
+
+
+def _job_name(spec: JobSpec) -> str:
+    return f"tree: {spec.idx} of scenario with {spec.leaf_count} leaves, alpha: {spec.alpha} and scale: {spec.scale}"
+
+
+def run_single_job(spec: JobSpec) -> TreeSummary:
+    assert spec.pattern
+    with time_func(f"Running {_job_name(spec)}"):
+        result = run_scenario(
+            spec.leaf_count, spec.scale, spec.idx, genome_size=spec.genome_size, alpha=spec.alpha,
+            ultrametric=spec.ultrametric, seed=spec.seed, fill_mode=spec.fill_mode,
+            subtree_processes=spec.subtree_processes, tree_generator=spec.tree_generator,
+            ultrametric_mode=spec.ultrametric_mode,
+            tree_library=TreeLibrary(spec.tree_library) if spec.tree_library is not None else None)
+    return _tree_summary(spec, result)
+
+
+def run_simulation_job(spec: JobSpec, genomes_name: str) -> SimulatedTree:
+    # First stage of the pipeline, leaves the genomes of the leaves in the shared memory named genomes_name
+    with time_func(f"Simulating {_job_name(spec)}"):
+        simulated, genomes = simulate_tree(
+            spec.leaf_count, spec.scale, spec.idx, genome_size=spec.genome_size, alpha=spec.alpha,
+            ultrametric=spec.ultrametric, seed=spec.seed, fill_mode=spec.fill_mode,
+            subtree_processes=spec.subtree_processes, tree_generator=spec.tree_generator,
+            ultrametric_mode=spec.ultrametric_mode,
+            tree_library=TreeLibrary(spec.tree_library) if spec.tree_library is not None else None)
+    with SharedGenomes.attach(genomes_name, spec.leaf_count, spec.genome_size) as shared:
+        shared.array[:] = genomes
+    return simulated
+
+
+def run_counting_job(spec: JobSpec, simulated: SimulatedTree, genomes_name: str) -> TreeSummary:
+    # Second stage of the pipeline
+    with SharedGenomes.attach(genomes_name, spec.leaf_count, spec.genome_size) as shared:
+        genomes = shared.array.tolist()
+    with time_func(f"Counting {_job_name(spec)}"):
+        occurrences, mean_occurrences = count_occurrences(genomes, spec.genome_size)
+    return _tree_summary(spec, Result(
+        simulated.model_tree, spec.genome_size, spec.scale, spec.leaf_count, simulated.total_jumps,
+        simulated.avg_jumps, spec.alpha, spec.seed, occurrences, mean_occurrences))
+
+
+def resume_summary(summary: ScaleSummary, entries: List[ManifestEntry], base_path: Path) -> Set[JobKey]:
+    # Fills the summary with the trees the manifest lists as done and returns their keys. The stored summary is used
+    # if it holds exactly these trees, otherwise it is rebuilt from their files, and trees whose file is gone are run
+    # again.
+    if summary.path.is_file():
+        stored = ScaleSummary.load(summary.path)
+        if sorted(stored.stats.seeds) == sorted(entry.seed for entry in entries):
+            summary.stats = stored.stats
+            return {entry.key for entry in entries}
+    done = set()
+    for entry in entries:
+        output = base_path / entry.output
+        if not output.is_file():
+            logging.warning("Tree file: %s is missing, running tree: %s again", output, entry.idx)
+            continue
+        summary.stats.add(entry.seed, read_mean_occurrences(output, summary.stats.genome_size))
+        done.add(entry.key)
+    return done
+
+
+class JobQueue:
+    # The trees a campaign still has to run, taken by the workers as they have room for them
+    def __init__(self, specs: List[JobSpec]):
+        self._pending = deque(specs)
+
+    def __iter__(self) -> 'JobQueue':
+        return self
+
+    def __next__(self) -> JobSpec:
+        if not self._pending:
+            raise StopIteration
+        return self._pending.popleft()
+
+    def finished(self, spec: JobSpec, tree_summary: Optional[TreeSummary]):
+        # Called for every tree once it is done, without a summary if it failed
+        pass
+
+
+class AdaptiveScenario:
+    def __init__(self, point: Configuration, scale: float, stats: OccurrenceStats, done: Set[JobKey]):
+        self.point = point
+        self.scale = scale
+        self.stats = stats  # Of the trees done so far, including the ones of previous runs
+        self.done = done
+        self.next_idx = 0
+        self.in_flight = 0
+
+
+class AdaptiveJobQueue(JobQueue):
+    # Queues a batch of trees for a scenario whenever its previous batch is done and its mean occurrences are not
+    # known well enough yet. Tree indices never go beyond max_trees, so failing trees can't keep a scenario running.
+    def __init__(self, adaptive: Adaptive, scenarios: List[AdaptiveScenario]):
+        super().__init__([])
+        self._adaptive = adaptive
+        self._scenarios = {(s.point.leaf_count, s.point.genome_size, s.point.alpha, s.scale): s for s in scenarios}
+
+    def converged(self, stats: OccurrenceStats) -> bool:
+        first, last = self._adaptive.island_sizes
+        half_widths = stats.confidence_half_widths(self._adaptive.confidence)[first:last + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = half_widths / np.abs(stats.means[first:last + 1])
+        return bool(np.all(relative <= self._adaptive.tolerance))  # Never with NaN, less than two trees
+
+    def is_done(self, scenario: AdaptiveScenario) -> bool:
+        count = scenario.stats.tree_count
+        return count >= self._adaptive.max_trees or scenario.next_idx >= self._adaptive.max_trees or (
+            count >= self._adaptive.min_trees and self.converged(scenario.stats))
+
+    def __next__(self) -> JobSpec:
+        if not self._pending:
+            self._queue_batches()
+        return super().__next__()
+
+    def _queue_batches(self):
+        for scenario in self._scenarios.values():
+            if scenario.in_flight or self.is_done(scenario):
+                continue
+            count = scenario.stats.tree_count
+            batch = min(
+                max(self._adaptive.min_trees - count, self._adaptive.batch_size), self._adaptive.max_trees - count)
+            while batch and scenario.next_idx < self._adaptive.max_trees:
+                spec = make_job_spec(scenario.point, scenario.scale, scenario.next_idx)
+                scenario.next_idx += 1
+                if spec.key in scenario.done:
+                    continue
+                self._pending.append(spec)
+                scenario.in_flight += 1
+                batch -= 1
+
+    def finished(self, spec: JobSpec, tree_summary: Optional[TreeSummary]):
+        scenario = self._scenarios[spec.scenario]
+        scenario.in_flight -= 1
+        if tree_summary is not None:
+            scenario.stats.add(tree_summary.seed, tree_summary.mean_occurrences)
+        if not scenario.in_flight and self.is_done(scenario):
+            logging.info(
+                "Scale: %s of scenario with %s leaves, genome size: %s and alpha: %s done after %s trees, "
+                "converged: %s", spec.scale, spec.leaf_count, spec.genome_size, spec.alpha, scenario.stats.tree_count,
+                self.converged(scenario.stats))
+
+
+def run_campaign(configuration: Configuration, scales: Optional[List[float]] = None):
+    # Runs the trees of every point of the campaign and every scale in a single pool, so its workers are kept busy
+    # across scales instead of waiting for the slowest tree of each. The largest trees are queued first. Trees found
+    # in the manifest of the data path are skipped, so a killed campaign continues where it stopped when run again.
+    # In adaptive mode every scale runs as many trees as its own variance requires.
     assert 0 < configuration.processes <= MAX_PROCESSES
-    print('run_scenarios, tree_count = ', configuration.tree_count)
-    pattern = configuration.file_pattern(scale)
-    init_tot_res(configuration.genome_size)
-    with futures.ThreadPoolExecutor(max_workers=configuration.processes) as executor:
-        jobs = [
-            executor.submit(
-                run_single_job, pattern, configuration.leaf_count, scale, configuration.data_path, configuration.alpha,
-                configuration.genome_size, idx, configuration.tree_count, configuration.ultrametric)
-            for idx in range(configuration.tree_count)]
-        print('run_scenarios ', jobs, configuration)
-        for job in futures.as_completed(jobs):
-            try:
-                job.result()
-                print('job.result ', job)
-            except Exception as e:
-                logging.exception("Failed running job!!!")
+    manifest = Manifest(configuration.data_path)
+    configuration = configuration._replace(seed=manifest.campaign_seed(configuration.seed))
+    logging.info("Campaign seed: %s", configuration.seed)
+    completed = manifest.read()
+    summaries: Dict[ScenarioKey, ScaleSummary] = {}
+    specs = []
+    adaptive_scenarios = []
+    done_count = 0
+    campaign = configuration.campaign(scales)
+    campaign.sort(key=lambda point_scale: point_scale[0].leaf_count * point_scale[0].genome_size, reverse=True)
+    for point, scale in campaign:
+        summary = ScaleSummary(
+            point.summary_path(scale), point.leaf_count, scale, point.alpha, point.genome_size)
+        point_specs = make_job_specs(point, scale, configuration.max_tree_count)
+        done = resume_summary(
+            summary, [completed[spec.key] for spec in point_specs if spec.key in completed], configuration.data_path)
+        summaries[point_specs[0].scenario] = summary
+        done_count += len(done)
+        if configuration.adaptive is not None:
+            stats = OccurrenceStats(point.genome_size)
+            stats.merge(summary.stats)
+            adaptive_scenarios.append(AdaptiveScenario(point, scale, stats, done))
+        else:
+            specs.extend(spec for spec in point_specs if spec.key not in done)
+        if done:
+            summary.save()
+    if configuration.adaptive is not None:
+        queue = AdaptiveJobQueue(configuration.adaptive, adaptive_scenarios)
+        logging.info("Running adaptive trees over %s scenarios, %s trees already done", len(campaign), done_count)
+    else:
+        queue = JobQueue(specs)
+        logging.info(
+            "Running %s trees over %s scenarios, %s trees already done", len(specs), len(campaign), done_count)
+
+    def record(spec: JobSpec, tree_summary: TreeSummary, output: Path):
+        # Runs once the tree file is written, so the manifest only lists complete files
+        manifest.append(ManifestEntry(
+            spec.leaf_count, spec.genome_size, spec.alpha, spec.scale, spec.idx, spec.seed,
+            str(output.relative_to(configuration.data_path))))
+        summary = summaries[spec.scenario]
+        summary.stats.add(tree_summary.seed, tree_summary.mean_occurrences)
+        summary.save()
+        if configuration.adaptive is None and summary.stats.tree_count == configuration.tree_count:
+            logging.info("Completed all trees of scale: %s, summary at: %s", spec.scale, summary.path)
+
+    def collect(spec: JobSpec, tree_summary: TreeSummary):
+        output = result_path(spec)
+        writer.write(
+            output, partial(tree_summary.result.to_json, indent=None),
+            partial(record, spec, tree_summary._replace(result=None), output))
 
+    with ResultWriter(
+            configuration.compression_level, configuration.compression_threads,
+            queue_size=configuration.processes) as writer:
+        if configuration.counting_processes:
+            run_pipeline_jobs(configuration, queue, collect)
+        else:
+            run_jobs(configuration, queue, collect)
+
+
+# Only a few jobs per worker are in flight at a time, so when collecting the results blocks (the writer falls behind)
+# the workers stop being fed instead of results piling up in memory
+
+def run_jobs(configuration: Configuration, queue: JobQueue, collect: Callable[[JobSpec, TreeSummary], None]):
+    max_in_flight = 2 * configuration.processes
+    with EXECUTORS[configuration.executor](max_workers=configuration.processes) as executor:
+        jobs = {}
+        while True:
+            for spec in islice(queue, max_in_flight - len(jobs)):
+                jobs[executor.submit(run_single_job, spec)] = spec
+            if not jobs:
+                break
+            finished, _ = futures.wait(jobs, return_when=futures.FIRST_COMPLETED)
+            for job in finished:
+                spec = jobs.pop(job)
+                try:
+                    tree_summary = job.result()
+                except Exception:
+                    logging.exception("Failed running tree: %s of scale: %s", spec.idx, spec.scale)
+                    tree_summary = None
+                queue.finished(spec, tree_summary)
+                if tree_summary is not None:
+                    collect(spec, tree_summary)
+
+
+def run_pipeline_jobs(configuration: Configuration, queue: JobQueue, collect: Callable[[JobSpec, TreeSummary], None]):
+    # Trees are simulated in a pool of processes and their occurrences are counted in a pool of counting_processes.
+    # The leaf genomes are handed over in shared memory, created here for every tree and released once it is counted.
+    max_in_flight = 2 * (configuration.processes + configuration.counting_processes)
+    shared: Dict[JobSpec, SharedGenomes] = {}
+    jobs: Dict[futures.Future, Tuple[JobSpec, bool]] = {}  # Job to its spec and whether it is counting
+    with futures.ProcessPoolExecutor(max_workers=configuration.processes) as simulators, \
+            futures.ProcessPoolExecutor(max_workers=configuration.counting_processes) as counters:
+        try:
+            while True:
+                for spec in islice(queue, max_in_flight - len(jobs)):
+                    shared[spec] = SharedGenomes.create(spec.leaf_count, spec.genome_size)
+                    jobs[simulators.submit(run_simulation_job, spec, shared[spec].name)] = spec, False
+                if not jobs:
+                    break
+                finished, _ = futures.wait(jobs, return_when=futures.FIRST_COMPLETED)
+                for job in finished:
+                    spec, counting = jobs.pop(job)
+                    try:
+                        if not counting:
+                            counting_job = counters.submit(run_counting_job, spec, job.result(), shared[spec].name)
+                            jobs[counting_job] = spec, True
+                            continue
+                        shared.pop(spec).close()
+                        tree_summary = job.result()
+                    except Exception:
+                        logging.exception("Failed running tree: %s of scale: %s", spec.idx, spec.scale)
+                        if spec in shared:
+                            shared.pop(spec).close()
+                        tree_summary = None
+                    queue.finished(spec, tree_summary)
+                    if tree_summary is not None:
+                        collect(spec, tree_summary)
+        finally:
+            for genomes in shared.values():
+                genomes.close()
+
+
+def run_scenarios(configuration: Configuration, scale: float):
+    run_campaign(configuration, [scale])
@@ -0,0 +1,52 @@
+import sys
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+GENE_DTYPE = np.int32
+
+
+class SharedGenomes:
+    # The leaf genomes of a tree as a leaves x genes array in shared memory, handed between processes by name. The
+    # process which creates it owns it and unlinks it, others only attach and close.
+    def __init__(self, shm: SharedMemory, leaf_count: int, genome_size: int, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self.array = np.ndarray((leaf_count, genome_size), dtype=GENE_DTYPE, buffer=shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @classmethod
+    def create(cls, leaf_count: int, genome_size: int) -> 'SharedGenomes':
+        size = leaf_count * genome_size * np.dtype(GENE_DTYPE).itemsize
+        return cls(SharedMemory(create=True, size=max(size, 1)), leaf_count, genome_size, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, leaf_count: int, genome_size: int) -> 'SharedGenomes':
+        if sys.version_info >= (3, 13):
+            shm = SharedMemory(name, track=False)
+        else:
+            # Before 3.13 attaching registers the segment with the resource tracker as well, which would unlink it
+            # (or warn about it) when this process exits
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = SharedMemory(name)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, leaf_count, genome_size, owner=False)
+
+    def close(self):
+        self.array = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> 'SharedGenomes':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
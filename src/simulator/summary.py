@@ -0,0 +1,130 @@
+import json
+import os
+import uuid
+from pathlib import Path
+from statistics import NormalDist
+from typing import Optional, Iterable, List
+
+import numpy as np
+
+SUMMARY_FORMAT_VERSION = 1
+
+
+class OccurrenceStats:
+    # Running count, mean and variance of the mean occurrences per island size over the trees of a scale (Welford).
+    # Arrays are indexed by island size, index 0 is unused. Stats of disjoint sets of trees, from other processes or
+    # runs, are combined with merge.
+    def __init__(self, genome_size: int):
+        self.genome_size = genome_size
+        self.counts = np.zeros(genome_size + 1, dtype=np.int64)
+        self.means = np.zeros(genome_size + 1)
+        self._m2 = np.zeros(genome_size + 1)
+        self.seeds: List[int] = []
+
+    @property
+    def tree_count(self) -> int:
+        return len(self.seeds)
+
+    @property
+    def variances(self) -> np.ndarray:
+        # Sample variance, NaN where less than two trees were seen
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.counts > 1, self._m2 / (self.counts - 1), np.nan)
+
+    def confidence_half_widths(self, confidence: float = 0.95) -> np.ndarray:
+        # Of the mean of every island size, normal approximation, NaN where less than two trees were seen
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return z * np.sqrt(self.variances / self.counts)
+
+    def add(self, seed: int, mean_occurrences: np.ndarray):
+        # Island sizes without a value (NaN) are left out
+        assert len(mean_occurrences) == self.genome_size + 1
+        assert seed not in self.seeds, f"Tree with seed {seed} added more than once"
+        seen = ~np.isnan(mean_occurrences)
+        seen[0] = False
+        values = mean_occurrences[seen]
+        self.counts[seen] += 1
+        delta = values - self.means[seen]
+        self.means[seen] += delta / self.counts[seen]
+        self._m2[seen] += delta * (values - self.means[seen])
+        self.seeds.append(seed)
+
+    def merge(self, other: 'OccurrenceStats'):
+        assert other.genome_size == self.genome_size
+        assert not set(self.seeds) & set(other.seeds), "Merged stats must come from different trees"
+        counts = self.counts + other.counts
+        seen = counts > 0
+        delta = other.means[seen] - self.means[seen]
+        self.means[seen] += delta * other.counts[seen] / counts[seen]
+        self._m2[seen] += other._m2[seen] + delta ** 2 * self.counts[seen] * other.counts[seen] / counts[seen]
+        self.counts = counts
+        self.seeds.extend(other.seeds)
+
+    def to_json(self) -> dict:
+        variances = self.variances
+        return {
+            "genome_size": self.genome_size,
+            "tree_count": self.tree_count,
+            "seeds": self.seeds,
+            "counts": self.counts[1:].tolist(),
+            "mean_occurrences": self.means[1:].tolist(),
+            "variances": [None if np.isnan(v) else v for v in variances[1:].tolist()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'OccurrenceStats':
+        stats = cls(int(data["genome_size"]))
+        stats.counts[1:] = data["counts"]
+        stats.means[1:] = data["mean_occurrences"]
+        variances = np.array([np.nan if v is None else v for v in data["variances"]], dtype=float)
+        stats._m2[1:] = np.nan_to_num(variances) * np.maximum(stats.counts[1:] - 1, 0)
+        stats.seeds = [int(seed) for seed in data["seeds"]]
+        return stats
+
+
+class ScaleSummary:
+    # The small file holding the aggregated occurrences of every tree of a scale, next to the tree files. It is
+    # rewritten whole after every tree, through a temporary file, so readers never see a partial summary.
+    def __init__(
+            self, path: Path, leaf_count: int, scale: float, alpha: float, genome_size: int,
+            stats: Optional[OccurrenceStats] = None):
+        self.path = path
+        self.leaf_count = leaf_count
+        self.scale = scale
+        self.alpha = alpha
+        self.stats = OccurrenceStats(genome_size) if stats is None else stats
+
+    def to_json(self) -> str:
+        data = {
+            "format_version": SUMMARY_FORMAT_VERSION,
+            "leaves_count": self.leaf_count,
+            "expected_edge_len": self.scale,
+            "alpha": self.alpha,
+            **self.stats.to_json()
+        }
+        return json.dumps(data)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{uuid.uuid4()}_{self.path.name}")
+        tmp_path.write_text(self.to_json())
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'ScaleSummary':
+        data = json.loads(path.read_text())
+        assert data["format_version"] == SUMMARY_FORMAT_VERSION, f"Unknown summary version: {data['format_version']}"
+        return cls(
+            path, data["leaves_count"], data["expected_edge_len"], data["alpha"], data["genome_size"],
+            OccurrenceStats.from_json(data))
+
+
+def merge_stats(all_stats: Iterable[OccurrenceStats]) -> OccurrenceStats:
+    merged = None
+    for stats in all_stats:
+        if merged is None:
+            merged = OccurrenceStats(stats.genome_size)
+        merged.merge(stats)
+    assert merged is not None, "No stats to merge"
+    return merged
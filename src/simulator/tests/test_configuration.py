@@ -1,9 +1,58 @@
+import json
 from pathlib import Path
 
-from src.simulator.configuration import parse_configuration
+import pytest
+
+from src.simulator.configuration import Adaptive, parse_configuration
 
 
 def test_configuration():
 	conf = parse_configuration(Path("~/university/jump_model_exp/python_proj/sample_config.json").expanduser())
 	assert conf
 	conf.validate()
+
+
+def _write_configuration(path, **values):
+	configuration = {
+		"data_path": str(path), "tree_count": 3, "alpha": 0.5, "genome_size": 64, "leaf_count": 8, "processes": 2,
+		"scale": [0.1, 0.3, 0.1], "ultrametric": True, "seed": 1}
+	configuration.update(values)
+	config_path = path / "config.json"
+	config_path.write_text(json.dumps(configuration))
+	return config_path
+
+
+def test_single_point(tmp_path):
+	conf = parse_configuration(_write_configuration(tmp_path))
+	conf.validate()
+	assert conf.scales() == [0.1, 0.2, 0.3]
+	assert [(point.alpha, point.genome_size, point.leaf_count, scale) for point, scale in conf.campaign()] == [
+		(0.5, 64, 8, 0.1), (0.5, 64, 8, 0.2), (0.5, 64, 8, 0.3)]
+
+
+@pytest.mark.parametrize("alpha,genome_size,leaf_count,points", [
+	([0.5, 1], 64, 8, 6),
+	(0.5, [32, 64, 128], [8, 16], 18),
+	([0.5], [64], [8], 3),
+])
+def test_campaign_grid(tmp_path, alpha, genome_size, leaf_count, points):
+	conf = parse_configuration(
+		_write_configuration(tmp_path, alpha=alpha, genome_size=genome_size, leaf_count=leaf_count))
+	conf.validate()
+	campaign = conf.campaign()
+	assert len(campaign) == points
+	assert len({point.file_pattern(scale) for point, scale in campaign}) == points
+	for point, _ in campaign:
+		assert not (point.alphas or point.genome_sizes or point.leaf_counts)
+	assert conf.campaign([0.2])[0][1] == 0.2
+
+
+def test_adaptive(tmp_path):
+	conf = parse_configuration(_write_configuration(
+		tmp_path, adaptive={"tolerance": 0.01, "min_trees": 20, "max_trees": 200, "island_sizes": [2, 10]}))
+	conf.validate()
+	assert conf.adaptive == Adaptive(0.01, 20, 200, (2, 10), batch_size=10, confidence=0.95)
+	assert conf.max_tree_count == 200
+	assert parse_configuration(_write_configuration(tmp_path)).max_tree_count == 3
+	with pytest.raises(AssertionError):
+		conf._replace(adaptive=conf.adaptive._replace(island_sizes=(2, 65))).validate()
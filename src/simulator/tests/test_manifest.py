@@ -0,0 +1,38 @@
+import pytest
+
+from src.simulator.manifest import Manifest, ManifestEntry
+
+
+def _entry(idx, scale=0.1):
+	return ManifestEntry(8, 64, 0.5, scale, idx, 1000 + idx, f"{scale}/{idx}.json.gz")
+
+
+def test_append_and_read(tmp_path):
+	manifest = Manifest(tmp_path)
+	assert manifest.read() == {}
+	entries = [_entry(idx, scale) for scale in (0.1, 0.2) for idx in range(3)]
+	for entry in entries:
+		manifest.append(entry)
+	assert Manifest(tmp_path).read() == {entry.key: entry for entry in entries}
+
+
+def test_partial_line(tmp_path):
+	manifest = Manifest(tmp_path)
+	manifest.append(_entry(0))
+	with manifest.path.open("a") as f:
+		f.write('{"leaf_count": 8, "genome_')
+	assert list(manifest.read().values()) == [_entry(0)]
+	manifest.append(_entry(1))
+	assert list(manifest.read().values()) == [_entry(0), _entry(1)]
+
+
+def test_campaign_seed(tmp_path):
+	seed = Manifest(tmp_path).campaign_seed()
+	assert Manifest(tmp_path).campaign_seed() == seed
+	assert Manifest(tmp_path).campaign_seed(seed) == seed
+	with pytest.raises(ValueError):
+		Manifest(tmp_path).campaign_seed(seed + 1)
+	other = tmp_path / "other"
+	other.mkdir()
+	assert Manifest(other).campaign_seed(7) == 7
+	assert Manifest(other).campaign_seed() == 7
@@ -0,0 +1,180 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+from src.simulator.configuration import Adaptive, Configuration, Scale
+from src.simulator.scenario import (
+	make_job_seed, run_scenario, run_scenarios, run_campaign)
+from src.simulator.manifest import Manifest, MANIFEST_NAME
+from src.simulator.summary import ScaleSummary
+from src.tree_library import TreeLibrary
+
+
+def test_job_seeds():
+	seeds = {make_job_seed(1234, scale / 10, idx) for scale in range(1, 7) for idx in range(100)}
+	assert len(seeds) == 600
+	assert make_job_seed(1234, 0.3, 7) == make_job_seed(1234, 0.3, 7)
+	assert make_job_seed(1234, 0.3, 7) != make_job_seed(4321, 0.3, 7)
+
+
+def test_run_scenario_with_tree_library(tmp_path):
+	results = [
+		run_scenario(16, 0.3, 0, genome_size=64, alpha=0.5, ultrametric=True, seed=41, tree_library=library)
+		for library in (None, TreeLibrary(tmp_path), TreeLibrary(tmp_path))]
+	for result in results[1:]:
+		assert result.model_tree.newick == results[0].model_tree.newick
+		assert result.occurrences == results[0].occurrences
+		assert result.total_jumps == results[0].total_jumps
+
+
+def _read_results(path):
+	results = {}
+	for output in path.glob("*/*.json.gz"):
+		with gzip.open(str(output), "r") as f:
+			data = json.loads(f.read())
+		results[data["seed"]] = data
+	return results
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+def test_run_scenarios(tmp_path, executor):
+	configuration = Configuration(
+		data_path=tmp_path, tree_count=3, alpha=0.5, genome_size=32, leaf_count=8, processes=2, ultrametric=True,
+		scale=Scale(0.1, 0.2, 0.1), seed=7, executor=executor)
+	configuration.validate()
+	run_scenarios(configuration, 0.1)
+	results = _read_results(tmp_path)
+	assert sorted(results) == sorted(make_job_seed(7, 0.1, idx) for idx in range(3))
+	for data in results.values():
+		assert data["format_version"] == 3
+		assert data["model"]["internal_edge_count"] == 8 - 3
+	summary = ScaleSummary.load(configuration.summary_path(0.1))
+	assert sorted(summary.stats.seeds) == sorted(results)
+	assert summary.leaf_count == 8 and summary.stats.genome_size == 32
+	means = np.array([
+		[json.loads(data["mean_occurrences"])[str(k)] for k in range(1, 33)] for data in results.values()])
+	assert np.allclose(summary.stats.means[1:], means.mean(axis=0))
+	assert np.allclose(summary.stats.variances[1:], means.var(axis=0, ddof=1), equal_nan=True)
+
+
+def test_run_campaign(tmp_path):
+	configuration = Configuration(
+		data_path=tmp_path, tree_count=2, alpha=0.5, genome_size=16, leaf_count=6, processes=2, ultrametric=True,
+		scale=Scale(0.1, 0.2, 0.1), seed=7, alphas=(0.5, 1.0), genome_sizes=(16, 24))
+	configuration.validate()
+	run_campaign(configuration)
+	campaign = configuration.campaign()
+	assert len(campaign) == 8
+	for point, scale in campaign:
+		summary = ScaleSummary.load(point.summary_path(scale))
+		assert sorted(summary.stats.seeds) == sorted(make_job_seed(7, scale, idx) for idx in range(2))
+		assert (summary.alpha, summary.stats.genome_size) == (point.alpha, point.genome_size)
+		assert len(list(summary.path.parent.glob(f"*_{point.file_pattern(scale)}.gz"))) == 2
+
+
+def _tree_files(path):
+	return sorted(path.glob("*/*.json.gz"))
+
+
+def test_resume_campaign(tmp_path):
+	configuration = Configuration(
+		data_path=tmp_path, tree_count=2, alpha=0.5, genome_size=16, leaf_count=6, processes=1, ultrametric=True,
+		scale=Scale(0.1, 0.2, 0.1), seed=7)
+	run_campaign(configuration)
+	first_files = _tree_files(tmp_path)
+	assert len(first_files) == 4
+	run_campaign(configuration)
+	assert _tree_files(tmp_path) == first_files
+	run_campaign(configuration._replace(tree_count=3))
+	assert len(_tree_files(tmp_path)) == 6
+	for scale in (0.1, 0.2):
+		summary = ScaleSummary.load(configuration.summary_path(scale))
+		assert sorted(summary.stats.seeds) == sorted(make_job_seed(7, scale, idx) for idx in range(3))
+
+
+def test_resume_campaign_without_seed(tmp_path):
+	configuration = Configuration(
+		data_path=tmp_path, tree_count=3, alpha=0.5, genome_size=16, leaf_count=6, processes=1, ultrametric=True,
+		scale=Scale(0.1, 0.2, 0.1))
+	configuration.validate()
+	run_campaign(configuration)
+	first_files = _tree_files(tmp_path)
+	assert len(first_files) == 6
+	run_campaign(configuration)
+	assert _tree_files(tmp_path) == first_files
+	assert len(Manifest(tmp_path).read()) == 6
+	seed = Manifest(tmp_path).campaign_seed()
+	run_campaign(configuration._replace(seed=seed))
+	assert _tree_files(tmp_path) == first_files
+	with pytest.raises(ValueError):
+		run_campaign(configuration._replace(seed=seed + 1))
+	assert _tree_files(tmp_path) == first_files
+
+
+def test_resume_killed_campaign(tmp_path):
+	configuration = Configuration(
+		data_path=tmp_path, tree_count=3, alpha=0.5, genome_size=16, leaf_count=6, processes=1, ultrametric=True,
+		scale=Scale(0.1, 0.2, 0.1), seed=7)
+	run_campaign(configuration, [0.1])
+	expected = ScaleSummary.load(configuration.summary_path(0.1))
+	# Killed while appending the last tree to the manifest, after writing the summary of an older tree
+	manifest = tmp_path / MANIFEST_NAME
+	lines = manifest.read_text().splitlines()
+	manifest.write_text("\n".join(lines[:-1]) + "\n" + lines[-1][:10])
+	ScaleSummary(configuration.summary_path(0.1), 6, 0.1, 0.5, 16).save()
+	run_campaign(configuration, [0.1])
+	assert len(_tree_files(tmp_path)) == 3
+	summary = ScaleSummary.load(configuration.summary_path(0.1))
+	assert sorted(summary.stats.seeds) == sorted(expected.stats.seeds)
+	assert np.allclose(summary.stats.means[1:], expected.stats.means[1:])
+	assert len(Manifest(tmp_path).read()) == 3
+
+
+def test_pipeline_matches_single_pool(tmp_path):
+	configuration = Configuration(
+		data_path=tmp_path / "single", tree_count=3, alpha=0.5, genome_size=24, leaf_count=7, processes=2,
+		ultrametric=True, scale=Scale(0.1, 0.2, 0.1), seed=11, executor="processes")
+	pipeline = configuration._replace(data_path=tmp_path / "pipeline", processes=1, counting_processes=2)
+	for conf in (configuration, pipeline):
+		conf.data_path.mkdir()
+		conf.validate()
+		run_campaign(conf)
+	single_results, pipeline_results = _read_results(configuration.data_path), _read_results(pipeline.data_path)
+	assert len(single_results) == 6
+	assert single_results == pipeline_results
+	for scale in (0.1, 0.2):
+		assert sorted(ScaleSummary.load(pipeline.summary_path(scale)).stats.seeds) == sorted(
+			make_job_seed(11, scale, idx) for idx in range(3))
+
+
+def _adaptive_configuration(path, adaptive):
+	return Configuration(
+		data_path=path, tree_count=5, alpha=0.5, genome_size=16, leaf_count=8, processes=2, ultrametric=True,
+		scale=Scale(0.2, 0.3, 0.1), seed=7, adaptive=adaptive)
+
+
+@pytest.mark.parametrize("tolerance,expected", [(1e-9, 7), (1e9, 3)])
+def test_adaptive_bounds(tmp_path, tolerance, expected):
+	configuration = _adaptive_configuration(tmp_path, Adaptive(tolerance, 3, 7, (2, 4), batch_size=2))
+	configuration.validate()
+	run_campaign(configuration)
+	for scale in (0.2, 0.3):
+		summary = ScaleSummary.load(configuration.summary_path(scale))
+		assert summary.stats.tree_count == expected
+		assert sorted(summary.stats.seeds) == sorted(make_job_seed(7, scale, idx) for idx in range(expected))
+
+
+def test_adaptive_converges(tmp_path):
+	adaptive = Adaptive(0.2, 2, 40, (2, 3), batch_size=3)
+	configuration = _adaptive_configuration(tmp_path, adaptive)
+	run_campaign(configuration, [0.3])
+	stats = ScaleSummary.load(configuration.summary_path(0.3)).stats
+	assert adaptive.min_trees <= stats.tree_count < adaptive.max_trees
+	relative = stats.confidence_half_widths(adaptive.confidence)[2:4] / stats.means[2:4]
+	assert (relative <= adaptive.tolerance).all()
+	# Resuming a converged scale runs nothing
+	files = _tree_files(tmp_path)
+	run_campaign(configuration, [0.3])
+	assert _tree_files(tmp_path) == files
@@ -0,0 +1,22 @@
+from concurrent import futures
+
+import numpy as np
+
+from src.simulator.shared_genomes import SharedGenomes
+
+
+def _fill(name, leaf_count, genome_size):
+	with SharedGenomes.attach(name, leaf_count, genome_size) as shared:
+		shared.array[:] = np.arange(leaf_count * genome_size).reshape(leaf_count, genome_size)
+
+
+def _read(name, leaf_count, genome_size):
+	with SharedGenomes.attach(name, leaf_count, genome_size) as shared:
+		return shared.array.tolist()
+
+
+def test_hand_over_between_processes():
+	with SharedGenomes.create(5, 7) as shared, futures.ProcessPoolExecutor(max_workers=2) as executor:
+		executor.submit(_fill, shared.name, 5, 7).result()
+		assert executor.submit(_read, shared.name, 5, 7).result() == np.arange(35).reshape(5, 7).tolist()
+		assert shared.array[4, 6] == 34
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from src.simulator.summary import OccurrenceStats, ScaleSummary, merge_stats
+
+
+def _means(count, genome_size, seed=0):
+	means = np.random.default_rng(seed).random((count, genome_size + 1)) * 10
+	means[:, 0] = np.nan
+	return means
+
+
+def _stats(means, seeds):
+	stats = OccurrenceStats(means.shape[1] - 1)
+	for seed, mean in zip(seeds, means):
+		stats.add(seed, mean)
+	return stats
+
+
+@pytest.mark.parametrize("count", [1, 2, 5, 30])
+def test_matches_numpy(count):
+	means = _means(count, 16)
+	stats = _stats(means, range(count))
+	assert stats.tree_count == count
+	assert (stats.counts[1:] == count).all()
+	assert np.allclose(stats.means[1:], means[:, 1:].mean(axis=0))
+	if count > 1:
+		assert np.allclose(stats.variances[1:], means[:, 1:].var(axis=0, ddof=1))
+	else:
+		assert np.isnan(stats.variances[1:]).all()
+
+
+def test_missing_island_sizes():
+	means = _means(4, 8)
+	means[1, 3] = means[2, 3] = np.nan
+	stats = _stats(means, range(4))
+	assert stats.counts[3] == 2 and stats.counts[4] == 4
+	assert np.isclose(stats.means[3], np.nanmean(means[:, 3]))
+	assert np.isclose(stats.variances[3], np.nanvar(means[:, 3], ddof=1))
+
+
+@pytest.mark.parametrize("split", [[0, 10, 30], [0, 1, 2, 30], [0, 15, 15, 30]])
+def test_merge(split):
+	means = _means(30, 12)
+	parts = [_stats(means[begin:end], range(begin, end)) for begin, end in zip(split, split[1:])]
+	merged = merge_stats(parts)
+	whole = _stats(means, range(30))
+	assert sorted(merged.seeds) == whole.seeds
+	assert (merged.counts == whole.counts).all()
+	assert np.allclose(merged.means, whole.means)
+	assert np.allclose(merged.variances, whole.variances, equal_nan=True)
+
+
+def test_merge_same_trees():
+	stats = _stats(_means(3, 4), range(3))
+	with pytest.raises(AssertionError):
+		stats.merge(_stats(_means(3, 4), range(2, 5)))
+	with pytest.raises(AssertionError):
+		stats.add(1, _means(1, 4)[0])
+
+
+def test_summary_round_trip(tmp_path):
+	path = tmp_path / "0.1" / "summary.json"
+	summary = ScaleSummary(path, 8, 0.1, 0.5, 10, _stats(_means(3, 10), [7, 8, 9]))
+	summary.save()
+	assert [p.name for p in path.parent.iterdir()] == ["summary.json"]
+	loaded = ScaleSummary.load(path)
+	assert (loaded.leaf_count, loaded.scale, loaded.alpha) == (8, 0.1, 0.5)
+	assert loaded.stats.seeds == [7, 8, 9]
+	assert np.allclose(loaded.stats.means, summary.stats.means)
+	assert np.allclose(loaded.stats.variances, summary.stats.variances, equal_nan=True)
+	loaded.stats.add(10, _means(1, 10, seed=1)[0])
+	summary.stats.add(10, _means(1, 10, seed=1)[0])
+	assert np.allclose(loaded.stats.variances[1:], summary.stats.variances[1:])
@@ -0,0 +1,69 @@
+import gzip
+import threading
+import time
+
+import pytest
+
+from src.simulator import writer as writer_module
+from src.simulator.writer import ResultWriter, compress, write_atomically
+
+
+@pytest.mark.parametrize("size", [0, 100, writer_module.BLOCK_SIZE, 3 * writer_module.BLOCK_SIZE + 17])
+@pytest.mark.parametrize("level,threads", [(9, 1), (1, 1), (6, 4)])
+def test_compress(size, level, threads):
+	data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+	assert gzip.decompress(compress(data, level, threads)) == data
+
+
+def test_write_atomically(tmp_path):
+	path = tmp_path / "result.json.gz"
+	write_atomically(path, b"first")
+	write_atomically(path, b"second")
+	assert path.read_bytes() == b"second"
+	assert [p.name for p in tmp_path.iterdir()] == ["result.json.gz"]
+
+
+def test_writer_order(tmp_path):
+	written = []
+	with ResultWriter(compression_level=1, queue_size=2) as writer:
+		for idx in range(10):
+			path = tmp_path / str(idx % 3) / f"{idx}.json.gz"
+			writer.write(path, lambda idx=idx: f'{{"idx": {idx}}}', lambda path=path: written.append(path))
+	assert [int(path.stem.split(".")[0]) for path in written] == list(range(10))
+	for path in written:
+		with gzip.open(str(path), "r") as f:
+			assert f.read().decode() == f'{{"idx": {path.name.split(".")[0]}}}'
+
+
+def test_writer_backpressure(tmp_path):
+	release = threading.Event()
+	queued = []
+
+	def slow():
+		release.wait()
+		return "{}"
+
+	with ResultWriter(queue_size=1) as writer:
+		def produce():
+			for idx in range(3):
+				writer.write(tmp_path / f"{idx}.json.gz", slow)
+				queued.append(idx)
+		producer = threading.Thread(target=produce)
+		producer.start()
+		time.sleep(0.2)
+		# One write in progress and one waiting in the queue, the third blocks
+		assert queued == [0, 1]
+		release.set()
+		producer.join()
+	assert queued == [0, 1, 2]
+	assert len(list(tmp_path.glob("*.json.gz"))) == 3
+
+
+def test_writer_failure(tmp_path):
+	def fail():
+		raise ValueError("oops")
+	written = []
+	with ResultWriter() as writer:
+		writer.write(tmp_path / "bad.json.gz", fail, lambda: written.append("bad"))
+		writer.write(tmp_path / "good.json.gz", lambda: "{}", lambda: written.append("good"))
+	assert written == ["good"]
@@ -0,0 +1,74 @@
+import gzip
+import logging
+import os
+import queue
+import threading
+from concurrent import futures
+from pathlib import Path
+from typing import Callable, Optional, NamedTuple
+
+DEFAULT_COMPRESSION_LEVEL = 9  # As gzip.open
+BLOCK_SIZE = 1 << 20
+
+
+def compress(data: bytes, level: int = DEFAULT_COMPRESSION_LEVEL, threads: int = 1) -> bytes:
+    # Gzip, with several threads every block is compressed as a gzip member of its own (as pigz --independent). zlib
+    # releases the GIL, so the blocks are compressed in parallel, and any gzip reader reads the members as one file.
+    if threads == 1 or len(data) <= BLOCK_SIZE:
+        return gzip.compress(data, compresslevel=level)
+    blocks = [data[start:start + BLOCK_SIZE] for start in range(0, len(data), BLOCK_SIZE)]
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        return b''.join(executor.map(lambda block: gzip.compress(block, compresslevel=level), blocks))
+
+
+def write_atomically(path: Path, data: bytes):
+    # Readers (and a resumed campaign) see either the whole file or none of it
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class _WriteRequest(NamedTuple):
+    path: Path
+    serialize: Callable[[], str]
+    on_written: Optional[Callable[[], None]]
+
+
+class ResultWriter:
+    # Serializes, compresses and writes files in a background thread, so neither the workers nor the thread collecting
+    # results spend time on it. The queue is bounded, when the writer falls behind write blocks until there is room.
+    # The on_written callbacks run in the writer thread, in the order of the writes.
+    def __init__(self, compression_level: int = DEFAULT_COMPRESSION_LEVEL, compression_threads: int = 1,
+                 queue_size: int = 8):
+        assert 0 <= compression_level <= 9
+        assert compression_threads > 0
+        self._compression_level = compression_level
+        self._compression_threads = compression_threads
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+
+    def __enter__(self) -> 'ResultWriter':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._queue.put(None)
+        self._thread.join()
+
+    def write(self, path: Path, serialize: Callable[[], str], on_written: Optional[Callable[[], None]] = None):
+        self._queue.put(_WriteRequest(path, serialize, on_written))
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            try:
+                request.path.parent.mkdir(parents=True, exist_ok=True)
+                write_atomically(
+                    request.path,
+                    compress(request.serialize().encode(), self._compression_level, self._compression_threads))
+                if request.on_written is not None:
+                    request.on_written()
+            except Exception:
+                logging.exception("Failed writing: %s", request.path)
@@ -0,0 +1,25 @@
+import pytest
+from numpy.random import default_rng
+
+from ..genome import Genome, get_neighbourhood
+
+
+@pytest.mark.parametrize("size", (1, 2, 5, 7))
+def test_neighbourhoods(size: int):
+	genes = default_rng(size).permutation(range(3, 18)).tolist()
+	genome = Genome(genes)
+	assert sorted(genome.positions[genes].tolist()) == list(range(len(genes)))
+	neighbourhoods = genome.neighbourhoods(size)
+	assert neighbourhoods.shape == (len(genes), 2 * size)
+	for gene, neighbourhood in zip(sorted(genes), neighbourhoods):
+		expected = get_neighbourhood(genes, gene, size)
+		assert set(neighbourhood.tolist()) == expected
+		assert genome.get_neighbourhood(gene, size) == expected
+
+
+def test_neighbourhoods_cache_is_bounded():
+	genome = Genome(list(range(100)))
+	for size in range(1, 20):
+		genome.neighbourhoods(size)
+	assert len(genome._neighborhoods) == Genome.NEIGHBOURHOODS_CACHE_SIZE
+	assert genome.neighbourhoods(19) is genome.neighbourhoods(19)
@@ -1,10 +1,11 @@
 import logging
-from typing import List
+from typing import List, Tuple
 
+import numpy as np
 import pytest
 from numpy.random import default_rng
 from src.genome import GenomeMaker, make_identity_genome, build_new_genome, NewPositions, Stayed, GenomeSegment, \
-    gather_stayed, get_occupied_by_jumps, get_didnt_jump
+    gather_stayed, get_occupied_by_jumps, get_didnt_jump, place_jumps
 
 
 class MockDefaultRNG:
@@ -181,3 +182,52 @@ def test_everything_jumps_together():
             exponential_func=lambda scale_, size_: [1]*size_, geometric_func=lambda p, size: [genome_size]*size))
     assert count_jumped(genome_maker, iterations=iterations) == iterations
 
+
+def _make_expected(genome_size: int, jumping: List[GenomeSegment], new_indexes: List[int]) -> List[int]:
+    genome = make_identity_genome(genome_size)
+    new_positions: NewPositions = dict(sorted(GenomeMaker._order_jumped(dict(zip(jumping, new_indexes))).items()))
+    stayed: Stayed = dict(sorted(gather_stayed(genome, new_positions).items()))
+    segments = build_new_genome(new_positions, stayed) if stayed else [
+        segment for jumps in new_positions.values() for segment in jumps]
+    return [gene for segment in segments for gene in genome.by_segment(segment)]
+
+
+def _make_jumps(rng, genome_size: int) -> Tuple[List[GenomeSegment], List[int]]:
+    jumping = []
+    index = int(rng.integers(genome_size))
+    while index < genome_size:
+        size = min(int(rng.geometric(0.3)), genome_size - index)
+        jumping.append(GenomeSegment(index, size))
+        index += size + int(rng.integers(4))
+    new_indexes = [int(rng.integers(genome_size - jump.size + 1)) for jump in jumping]
+    return jumping, new_indexes
+
+
+@pytest.mark.parametrize("seed", range(64))
+def test_place_jumps(seed: int):
+    rng = default_rng(seed)
+    genome_size = 32
+    cases = [_make_jumps(rng, genome_size) for _ in range(4)]
+    rows = np.array([row for row, (jumping, _) in enumerate(cases) for _ in jumping], dtype=int)
+    starts = np.array([jump.start for jumping, _ in cases for jump in jumping], dtype=int)
+    sizes = np.array([jump.size for jumping, _ in cases for jump in jumping], dtype=int)
+    new_indexes = np.array([index for _, indexes in cases for index in indexes], dtype=int)
+    genomes = np.tile(np.arange(1, genome_size + 1), (len(cases), 1))
+    placed = place_jumps(genomes, rows, starts, sizes, new_indexes)
+    for row, (jumping, indexes) in enumerate(cases):
+        assert placed[row].tolist() == _make_expected(genome_size, jumping, indexes)
+
+
+@pytest.mark.parametrize("scale", (0.1, 0.5, 1))
+@pytest.mark.parametrize("alpha", (0.1, 0.5, 1))
+def test_make_batch(scale: float, alpha: float):
+    genome_maker = GenomeMaker(1, alpha)
+    genome_size = 64
+    genomes = np.tile(np.arange(1, genome_size + 1), (16, 1))
+    jumped, made = genome_maker.make_batch(genomes, np.full(16, scale))
+    assert made.shape == genomes.shape
+    assert jumped.shape == (16,)
+    for row, count in zip(made, jumped):
+        assert sorted(row.tolist()) == list(range(1, genome_size + 1))
+        if count == 0:
+            assert row.tolist() == list(range(1, genome_size + 1))
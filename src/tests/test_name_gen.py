@@ -0,0 +1,34 @@
+import pytest
+
+from ..name_gen import NameGenerator, LegacyNameGenerator, BASE_26, BASE_62
+
+
+def _names(name_gen, count: int):
+	return [name_gen.next() for _ in range(count)]
+
+
+def test_base_26():
+	names = _names(NameGenerator(), 26 + 26 ** 2 + 1)
+	assert names[:3] == ["A", "B", "C"]
+	assert names[25:28] == ["Z", "AA", "AB"]
+	assert names[-2:] == ["ZZ", "AAA"]
+
+
+@pytest.mark.parametrize("alphabet", (BASE_26, BASE_62))
+def test_unique_short_names(alphabet: str):
+	names = _names(NameGenerator(alphabet), 100000)
+	assert len(set(names)) == len(names)
+	assert max(map(len, names)) <= (4 if alphabet == BASE_26 else 3)
+	assert all(set(name) <= set(alphabet) for name in names)
+
+
+def test_reserved_names():
+	name_gen = NameGenerator(reserved=("B", "AA"))
+	assert _names(name_gen, 27) == ["A"] + list(BASE_26[2:]) + ["AB", "AC"]
+	names = _names(NameGenerator("ORT"), 3 ** 4)
+	assert "ROOT" not in names and "ROOO" in names and "RORO" in names
+
+
+def test_legacy_names():
+	names = _names(LegacyNameGenerator(), 28)
+	assert names[25:] == ["Z", "ZA", "ZB"]
@@ -0,0 +1,209 @@
+import io
+import itertools
+from math import isclose
+
+import numpy as np
+import pytest
+
+from ..genome import GenomeMaker
+from ..tree import YuleTreeGenerator, FILL_MODES, iter_leaf_genomes, fill_genome_by_subtrees, ArrayYuleTreeGenerator, \
+	ULTRAMETRIC_EXTEND, node_depths, TreeNode, write_newick, FlatTree, fill_genome_by_level, fill_flat_genomes
+
+
+@pytest.mark.parametrize("fill_mode", FILL_MODES.keys())
+@pytest.mark.parametrize("ultrametric", (False, True))
+def test_fill_modes(fill_mode: str, ultrametric: bool):
+	genome_size = 64
+	tree = YuleTreeGenerator(size=32, scale=0.5, seed=7).construct(ultrametric)
+	total_jumped = []
+	FILL_MODES[fill_mode](tree.root, genome_size=genome_size, total_jumped=total_jumped, maker=GenomeMaker(7, 0.5))
+	assert len(total_jumped) == tree.root.branch_len_stats().count
+	assert sum(total_jumped) > 0
+	for leaf in tree.leaves:
+		assert sorted(leaf.genome.genes) == list(range(1, genome_size + 1))
+
+
+def test_streaming_matches_recursive():
+	trees = [YuleTreeGenerator(size=32, scale=0.5, seed=3).construct(True) for _ in range(2)]
+	jumps = [[], []]
+	FILL_MODES["recursive"](trees[0].root, genome_size=64, total_jumped=jumps[0], maker=GenomeMaker(3, 0.5))
+	yielded = list(
+		iter_leaf_genomes(trees[1].root, genome_size=64, total_jumped=jumps[1], maker=GenomeMaker(3, 0.5)))
+	assert jumps[0] == jumps[1]
+	assert sorted(leaf.id for leaf in yielded) == sorted(leaf.id for leaf in trees[1].leaves)
+	for expected, leaf in zip(trees[0].leaves, trees[1].leaves):
+		assert expected.genome == leaf.genome
+	to_check = [trees[1].root]
+	while to_check:
+		node = to_check.pop()
+		assert (node.genome is None) == bool(node.children)
+		to_check.extend(node.children)
+
+
+def test_subtrees_independent_of_processes():
+	leaves = []
+	for processes in (1, 2):
+		tree = YuleTreeGenerator(size=64, scale=0.5, seed=5).construct(True)
+		total_jumped = []
+		fill_genome_by_subtrees(
+			tree.root, genome_size=64, total_jumped=total_jumped, maker=GenomeMaker(5, 0.5), processes=processes)
+		assert len(total_jumped) == tree.root.branch_len_stats().count
+		leaves.append({leaf.id: leaf.genome.genes for leaf in tree.leaves})
+	assert leaves[0] == leaves[1]
+
+
+@pytest.mark.parametrize("ultrametric", (False, True))
+@pytest.mark.parametrize("size", (1, 2, 3, 100))
+def test_array_yule_tree(size: int, ultrametric: bool):
+	tree = ArrayYuleTreeGenerator(size=size, scale=0.5, seed=11).generate(ultrametric)
+	assert len(tree.parents) == 2 * size - 1
+	assert sorted(tree.leaves.tolist()) == [idx for idx in range(len(tree.parents)) if idx not in tree.parents]
+	assert (tree.parents >= 0).sum() == len(tree.parents) - 1
+	view = tree.to_tree_view()
+	assert len(view.leaves) == size
+	assert all(not leaf.children for leaf in view.leaves)
+	assert len({leaf.name for leaf in view.leaves}) == size
+	if size > 1:
+		assert view.root.branch_len_stats().count == 2 * size - 2
+		assert all(len(node.children) == 2 for node in _internal_nodes(view.root))
+	again = ArrayYuleTreeGenerator(size=size, scale=0.5, seed=11).construct(ultrametric)
+	assert again.root.to_newick() == view.root.to_newick()
+
+
+def _internal_nodes(root):
+	to_visit = [root]
+	while to_visit:
+		node = to_visit.pop()
+		if node.children:
+			yield node
+			to_visit.extend(node.children)
+
+
+@pytest.mark.parametrize("generator", (YuleTreeGenerator, ArrayYuleTreeGenerator))
+def test_extend_ultrametric(generator):
+	tree = generator(size=64, scale=0.5, seed=13).construct(True, ULTRAMETRIC_EXTEND)
+	nodes, depths = node_depths(tree.root)
+	assert np.allclose(depths, [node.distance_from_root() for node in nodes])
+	leaf_depths = [leaf.distance_from_root() for leaf in tree.leaves]
+	assert all(isclose(depth, max(leaf_depths)) for depth in leaf_depths)
+
+
+def test_parent_array_depths():
+	tree = ArrayYuleTreeGenerator(size=64, scale=0.5, seed=17).generate(True)
+	view = tree.to_tree_view()
+	nodes, depths = node_depths(view.root)
+	assert np.allclose(tree.depths()[[node.id for node in nodes]], depths)
+
+
+def _recursive_newick(node) -> str:
+	res = ''
+	if node.children:
+		res += f"({','.join((_recursive_newick(child) for child in node.children))})"
+	if node.name:
+		res += node.name
+	if node.edge_len:
+		res += f":{node.edge_len}"
+	if node.btstrp:
+		res += f":{node.btstrp}"
+	if node.father is None:
+		res += ';'
+	return res
+
+
+@pytest.mark.parametrize("ultrametric", (False, True))
+def test_to_newick(ultrametric: bool):
+	tree = YuleTreeGenerator(size=64, scale=0.5, seed=19).construct(ultrametric)
+	assert tree.root.to_newick() == _recursive_newick(tree.root)
+	subtree = tree.root.children[0]
+	assert subtree.to_newick() == _recursive_newick(subtree)
+	assert TreeNode(0, name="A").to_newick() == "A;"
+
+
+def test_to_newick_precision():
+	root = TreeNode(0, children=[TreeNode(1, name="A", edge_len=0.123456), TreeNode(2, name="B", edge_len=1 / 3)])
+	assert root.to_newick(precision=3) == "(A:0.123,B:0.333);"
+	stream = io.StringIO()
+	write_newick(root, stream, precision=2)
+	assert stream.getvalue() == "(A:0.12,B:0.33);"
+
+
+def test_to_newick_deep_tree():
+	root = TreeNode(0)
+	node = root
+	for idx in range(1, 20000):
+		child = TreeNode(idx, name=f"L{idx}", edge_len=1.0, father=node)
+		node.children = [child, TreeNode(-idx, name=f"R{idx}", edge_len=2.0, father=node)]
+		node = child
+	newick = root.to_newick()
+	assert newick.count('(') == newick.count(')') == 19999
+	assert newick.endswith(";")
+
+
+@pytest.mark.parametrize("size", (1, 2, 64))
+def test_flat_tree_from_parent_array(size: int):
+	tree = ArrayYuleTreeGenerator(size=size, scale=0.5, seed=23).generate(True)
+	flat = FlatTree.from_parent_array(tree)
+	view = tree.to_tree_view()
+	assert flat.to_newick() == view.root.to_newick()
+	assert flat.to_tree_view().root.to_newick() == view.root.to_newick()
+	assert np.allclose(flat.depths(), tree.depths()[flat.ids])
+	if size > 1:
+		assert flat.branch_len_stats() == view.root.branch_len_stats()
+
+
+def test_flat_tree_from_tree_node():
+	tree = YuleTreeGenerator(size=64, scale=0.5, seed=29).construct()
+	flat = FlatTree.from_tree_node(tree.root)
+	nodes, depths = node_depths(tree.root)
+	assert flat.ids.tolist() == [node.id for node in nodes]
+	assert np.allclose(flat.depths(), depths)
+	assert flat.branch_len_stats() == tree.root.branch_len_stats()
+	assert flat.to_newick(precision=4) == tree.root.to_newick(precision=4)
+	assert FlatTree.from_newick(tree.root.to_newick()).to_newick().count(',') == 63
+	masks = flat.clade_masks()
+	assert len(masks) == 63
+	leaf_ids = flat.ids[flat.leaves]
+	for node, mask in zip(itertools.compress(nodes, [bool(node.children) for node in nodes]), masks):
+		under = {leaf.id for leaf in _leaves_under(node)}
+		assert set(leaf_ids[mask].tolist()) == under
+
+
+def _leaves_under(root):
+	to_visit = [root]
+	while to_visit:
+		node = to_visit.pop()
+		if node.children:
+			to_visit.extend(node.children)
+		else:
+			yield node
+
+
+def test_flat_tree_rejects_other_orders():
+	with pytest.raises(ValueError):
+		FlatTree.from_pre_order([-1, 0, 0, 1], [np.nan, 1.0, 1.0, 1.0], ["", "", "B", "A"])
+
+
+def test_fill_flat_genomes():
+	tree = YuleTreeGenerator(size=64, scale=0.5, seed=31).construct(True)
+	flat = FlatTree.from_tree_node(tree.root)
+	jumps = [[], []]
+	fill_genome_by_level(tree.root, genome_size=64, total_jumped=jumps[0], maker=GenomeMaker(31, 0.5))
+	genomes = fill_flat_genomes(flat, genome_size=64, total_jumped=jumps[1], maker=GenomeMaker(31, 0.5))
+	assert jumps[0] == jumps[1]
+	leaves = {leaf.id: leaf.genome.genes for leaf in tree.leaves}
+	assert [leaves[id_] for id_ in flat.ids[flat.leaves].tolist()] == genomes.tolist()
+
+
+@pytest.mark.parametrize("size", (1, 2, 64))
+def test_flat_fill_mode_matches_level(size: int):
+	trees = [ArrayYuleTreeGenerator(size=size, scale=0.5, seed=37).construct(True) for _ in range(2)]
+	jumps = [[], []]
+	FILL_MODES["level"](trees[0].root, genome_size=64, total_jumped=jumps[0], maker=GenomeMaker(37, 0.5))
+	FILL_MODES["flat"](trees[1].root, genome_size=64, total_jumped=jumps[1], maker=GenomeMaker(37, 0.5))
+	assert jumps[0] == jumps[1]
+	assert [leaf.genome for leaf in trees[0].leaves] == [leaf.genome for leaf in trees[1].leaves]
+	to_check = [trees[1].root]
+	while to_check:
+		node = to_check.pop()
+		assert (node.genome is None) == bool(node.children)
+		to_check.extend(node.children)
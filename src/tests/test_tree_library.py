@@ -0,0 +1,33 @@
+import pytest
+
+from ..genome import GenomeMaker
+from ..tree import TREE_GENERATORS, ULTRAMETRIC_EXTEND, fill_genome_by_subtrees
+from ..tree_library import TreeLibrary
+
+
+@pytest.mark.parametrize("tree_generator", TREE_GENERATORS.keys())
+@pytest.mark.parametrize("ultrametric", (False, True))
+def test_tree_library(tmp_path, tree_generator: str, ultrametric: bool):
+	library = TreeLibrary(tmp_path / "trees")
+	built = TREE_GENERATORS[tree_generator](size=32, scale=0.3, seed=37).construct(ultrametric)
+	trees = [library.get(32, 0.3, ultrametric, 37, tree_generator) for _ in range(2)]
+	assert library.tree_path(32, 0.3, ultrametric, 37, tree_generator).is_file()
+	assert len(list((tmp_path / "trees").iterdir())) == 1
+	for tree in trees:
+		assert tree.root.to_newick() == built.root.to_newick()
+		assert [leaf.name for leaf in tree.leaves] == [leaf.name for leaf in built.leaves]
+		assert [leaf.id for leaf in tree.leaves] == [leaf.id for leaf in built.leaves]
+		total_jumped = []
+		fill_genome_by_subtrees(tree.root, genome_size=32, total_jumped=total_jumped, maker=GenomeMaker(37, 0.5))
+	assert [leaf.genome for leaf in trees[0].leaves] == [leaf.genome for leaf in trees[1].leaves]
+
+
+def test_tree_library_keys(tmp_path):
+	library = TreeLibrary(tmp_path)
+	library.get(16, 0.3, True, 1)
+	library.get(16, 0.3, True, 1, ultrametric_mode=ULTRAMETRIC_EXTEND)
+	library.get(16, 0.3, False, 1, ultrametric_mode=ULTRAMETRIC_EXTEND)
+	library.get(16, 0.3, False, 1)
+	library.get(16, 0.4, False, 1)
+	library.get(16, 0.4, False, 2)
+	assert len(list(tmp_path.iterdir())) == 5
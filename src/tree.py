@@ -1,9 +1,12 @@
+import io
 import itertools
 import logging
 import statistics
 import struct
+from concurrent import futures
 from math import isclose
-from typing import NamedTuple, Optional, List, Tuple
+from typing import NamedTuple, Optional, List, Tuple, Iterator, Dict, TextIO, Union
+import numpy as np
 from numpy.random import default_rng
 from .name_gen import NameGenerator
 from .genome import Genome, GenomeMaker, make_identity_genome
@@ -19,6 +22,8 @@ class BranchLenStats(NamedTuple):
 
 
 class TreeNode:
+    __slots__ = ("id", "father", "children", "name", "edge_len", "btstrp", "genome")
+
     def __init__(
             self, id_: int, name: str = '', edge_len: Optional[float] = None, bootstrap: Optional[float] = None,
             children: Optional[List["TreeNode"]] = None, father: Optional["TreeNode"] = None):
@@ -34,10 +39,13 @@ class TreeNode:
             child.father = self
         self.genome: Optional[Genome] = None
 
-    def distance_from_root(self) -> float:  # TODO: This can be cached
-        if self.father is None:
-            return 0
-        return (self.edge_len or 0) + self.father.distance_from_root()
+    def distance_from_root(self) -> float:  # Use node_depths to get the distance of many nodes in a single pass
+        distance = 0
+        node = self
+        while node.father is not None:
+            distance += node.edge_len or 0
+            node = node.father
+        return distance
 
     def extend(self, extend_to: float):
         my_distance = self.distance_from_root()
@@ -51,19 +59,10 @@ class TreeNode:
         assert isclose(new_distance, extend_to), f"Failed extending node {self.name}! distance {new_distance} expected: {extend_to}"
         logging.debug("Done extending, new length [%s]", new_distance)
 
-    def to_newick(self) -> str:
-        res = ''
-        if self.children:
-            res += f"({','.join((child.to_newick() for child in self.children))})"
-        if self.name:
-            res += self.name
-        if self.edge_len:
-            res += f":{self.edge_len}"
-        if self.btstrp:
-            res += f":{self.btstrp}"
-        if self.father is None:
-            res += ';'
-        return res
+    def to_newick(self, precision: Optional[int] = None) -> str:
+        res = io.StringIO()
+        write_newick(self, res, precision=precision)
+        return res.getvalue()
 
     def print_genome(self, indent: int = 0, max_name_length: int = 8):
         prefix = " " * indent
@@ -114,11 +113,70 @@ class TreeNode:
         return BranchLenStats(sum(lengths) / count, statistics.median(lengths), count)
 
 
+def write_newick(root: TreeNode, stream: TextIO, precision: Optional[int] = None):
+    # Streams the tree without recursion, edge lengths are written with the given number of decimal digits (as is
+    # when not given). Pending items are either nodes to write or text closing a subtree.
+    def _node_suffix(node: TreeNode) -> str:
+        suffix = node.name or ''
+        if node.edge_len:
+            suffix += f":{node.edge_len}" if precision is None else f":{node.edge_len:.{precision}f}"
+        if node.btstrp:
+            suffix += f":{node.btstrp}"
+        return suffix
+
+    to_write: List[Union[TreeNode, str]] = [root]
+    while to_write:
+        item = to_write.pop()
+        if isinstance(item, str):
+            stream.write(item)
+        elif item.children:
+            stream.write('(')
+            to_write.append(')' + _node_suffix(item))
+            for idx, child in enumerate(reversed(item.children)):
+                if idx:
+                    to_write.append(',')
+                to_write.append(child)
+        else:
+            stream.write(_node_suffix(item))
+    if root.father is None:
+        stream.write(';')
+
+
 class TreeView(NamedTuple):
     root: TreeNode
     leaves: List[TreeNode]
 
 
+ULTRAMETRIC_HANG = "hang"
+ULTRAMETRIC_EXTEND = "extend"
+ULTRAMETRIC_MODES = (ULTRAMETRIC_HANG, ULTRAMETRIC_EXTEND)
+
+
+def node_depths(root: TreeNode) -> Tuple[List[TreeNode], np.ndarray]:
+    # All the nodes in pre-order and their distances from the root, computed top-down in a single pass
+    nodes = []
+    depths = []
+    to_visit = [(root, 0.0)]
+    while to_visit:
+        node, depth = to_visit.pop()
+        nodes.append(node)
+        depths.append(depth)
+        to_visit.extend((child, depth + (child.edge_len or 0)) for child in reversed(node.children))
+    return nodes, np.array(depths)
+
+
+def extend_to_ultrametric(root: TreeNode):
+    # Extends the edge of every leaf so all the leaves are as far from the root as the farthest one
+    if not root.children:
+        return
+    nodes, depths = node_depths(root)
+    is_leaf = np.array([not node.children for node in nodes])
+    leaf_depths = depths[is_leaf]
+    max_depth = leaf_depths.max()
+    for leaf, depth in zip(itertools.compress(nodes, is_leaf), leaf_depths.tolist()):
+        leaf.edge_len = (leaf.edge_len or 0) + (max_depth - depth)
+
+
 class YuleTreeGenerator:  # TODO: Calculate average branch length, assert that it is as expected
     FLOATING_PNT_DIGITS = 5
 
@@ -129,6 +187,7 @@ class YuleTreeGenerator:  # TODO: Calculate average branch length, assert that i
         self._size = size
         self._scale = scale
         self._leaves: List[TreeNode] = []
+        self._root: Optional[TreeNode] = None
         self._last_id = 0
 
     def new_id(self) -> int:
@@ -158,20 +217,23 @@ class YuleTreeGenerator:  # TODO: Calculate average branch length, assert that i
         to_hang.father = new_father
         self._leaves.append(siebling)
 
-    def construct(self, ultrametric: bool = False) -> TreeView:
+    def construct(self, ultrametric: bool = False, ultrametric_mode: str = ULTRAMETRIC_HANG) -> TreeView:
+        assert ultrametric_mode in ULTRAMETRIC_MODES
         root = TreeNode(0)
+        self._root = root
         if self._size == 1:
             return TreeView(root, [root])
+        hang = ultrametric and ultrametric_mode == ULTRAMETRIC_HANG
         self._leaves.append(root)
         while len(self._leaves) < self._size:
             leaf: TreeNode = self._rndm_gen.choice(self._leaves)
             assert not leaf.children
-            if ultrametric and leaf is not root:
+            if hang and leaf is not root:
                 self._hang(leaf)
             else:
                 self._split(leaf)
-        # if ultrametric:  # TODO: This is a naive implementation of ultrametric construction
-        #     self.complete_max_depth()
+        if ultrametric and ultrametric_mode == ULTRAMETRIC_EXTEND:
+            self.complete_max_depth()
         self.name_leaves()
         return TreeView(root, self._leaves)
 
@@ -181,10 +243,273 @@ class YuleTreeGenerator:  # TODO: Calculate average branch length, assert that i
             leaf.name = name_gen.next()
 
     def complete_max_depth(self):
-        max_edge_len = max(leaf.distance_from_root() for leaf in self._leaves)
-        for leaf in self._leaves:
-            leaf.extend(max_edge_len)
-        assert all(isclose(leaf.distance_from_root(), max_edge_len) for leaf in self._leaves)
+        assert self._root is not None
+        extend_to_ultrametric(self._root)
+
+
+def tree_levels(parents: np.ndarray) -> List[np.ndarray]:
+    # The nodes of a parent array (rooted at 0) grouped by their number of edges from the root, top-down. Every level
+    # lists the children of the previous one in its order, siblings in ascending index order.
+    node_count = len(parents)
+    assert parents[0] == -1
+    by_father = np.argsort(parents, kind="stable")[1:]
+    offsets = np.searchsorted(parents[by_father], np.arange(node_count + 1))
+    levels = []
+    level = np.zeros(1, dtype=int)
+    while len(level):
+        levels.append(level)
+        counts = offsets[level + 1] - offsets[level]
+        starts = np.repeat(offsets[level] - (np.cumsum(counts) - counts), counts)
+        level = by_father[starts + np.arange(counts.sum())]
+    return levels
+
+
+def subtree_sizes(parents: np.ndarray, levels: Optional[List[np.ndarray]] = None) -> np.ndarray:
+    # The number of nodes under every node (itself included), accumulated bottom-up one level at a time
+    if levels is None:
+        levels = tree_levels(parents)
+    sizes = np.ones(len(parents), dtype=int)
+    for level in reversed(levels[1:]):
+        np.add.at(sizes, parents[level], sizes[level])
+    return sizes
+
+
+class ParentArrayTree(NamedTuple):
+    parents: np.ndarray  # The index of every node's father, -1 for the root
+    edge_lens: np.ndarray  # The length of the edge leading to every node, 0 for the root
+    leaves: np.ndarray  # The indexes of the leaves, in naming order
+
+    def to_tree_view(self) -> TreeView:
+        nodes = [
+            TreeNode(idx, edge_len=float(edge_len) if father >= 0 else None)
+            for idx, (father, edge_len) in enumerate(zip(self.parents.tolist(), self.edge_lens.tolist()))]
+        for node, father in zip(nodes, self.parents.tolist()):
+            if father >= 0:
+                node.father = nodes[father]
+                nodes[father].children.append(node)
+        leaves = [nodes[idx] for idx in self.leaves.tolist()]
+        name_gen = NameGenerator()
+        for leaf in leaves:
+            leaf.name = name_gen.next()
+        return TreeView(nodes[0], leaves)
+
+    def depths(self) -> np.ndarray:
+        # The distance of every node from the root, computed top-down one tree level at a time
+        depths = np.zeros(len(self.parents))
+        for level in tree_levels(self.parents)[1:]:
+            depths[level] = depths[self.parents[level]] + self.edge_lens[level]
+        return depths
+
+    def extend_to_ultrametric(self) -> 'ParentArrayTree':
+        if len(self.parents) == 1:
+            return self
+        leaf_depths = self.depths()[self.leaves]
+        edge_lens = self.edge_lens.copy()
+        edge_lens[self.leaves] += leaf_depths.max() - leaf_depths
+        return self._replace(edge_lens=edge_lens)
+
+
+class FlatTree(NamedTuple):
+    # A tree as arrays in pre-order: node 0 is the root, the subtree of a node spans the subtree_sizes[node] indexes
+    # starting at it and its children are children[child_offsets[node]:child_offsets[node + 1]]
+    parents: np.ndarray  # -1 for the root
+    edge_lens: np.ndarray  # NaN where the node has no edge length
+    bootstraps: np.ndarray  # NaN where the node has no bootstrap
+    child_offsets: np.ndarray
+    children: np.ndarray
+    subtree_sizes: np.ndarray
+    names: List[str]
+    ids: np.ndarray  # The id of the TreeNode every node stands for
+
+    @classmethod
+    def from_pre_order(
+            cls, parents: np.ndarray, edge_lens: np.ndarray, names: List[str], ids: Optional[np.ndarray] = None,
+            bootstraps: Optional[np.ndarray] = None) -> 'FlatTree':
+        parents = np.asarray(parents, dtype=int)
+        node_count = len(parents)
+        children = np.argsort(parents, kind="stable")[1:]
+        child_offsets = np.searchsorted(parents[children], np.arange(node_count + 1))
+        sizes = subtree_sizes(parents)
+        # In pre-order the first child follows its father and every other child follows the subtree of its sibling
+        fathers = parents[children]
+        first_child = np.r_[True, fathers[1:] != fathers[:-1]][:len(children)]
+        expected = np.where(first_child, fathers + 1, np.r_[0, children[:-1] + sizes[children[:-1]]][:len(children)])
+        if len(names) != node_count or not np.array_equal(children, expected):
+            raise ValueError("Nodes must be given in pre-order")
+        if ids is None:
+            ids = np.arange(node_count)
+        if bootstraps is None:
+            bootstraps = np.full(node_count, np.nan)
+        return cls(
+            parents, np.asarray(edge_lens, dtype=float), np.asarray(bootstraps, dtype=float), child_offsets, children,
+            sizes, list(names), np.asarray(ids))
+
+    @classmethod
+    def from_tree_node(cls, root: TreeNode) -> 'FlatTree':
+        nodes = []
+        parents = []
+        to_visit = [(root, -1)]
+        while to_visit:
+            node, father = to_visit.pop()
+            parents.append(father)
+            to_visit.extend((child, len(nodes)) for child in reversed(node.children))
+            nodes.append(node)
+        return cls.from_pre_order(
+            parents, [np.nan if node.edge_len is None else node.edge_len for node in nodes],
+            [node.name or '' for node in nodes], [node.id for node in nodes],
+            [np.nan if node.btstrp is None else node.btstrp for node in nodes])
+
+    @classmethod
+    def from_parent_array(cls, tree: ParentArrayTree) -> 'FlatTree':
+        # Same tree (and leaf names) as tree.to_tree_view(), the pre-order position of a node is the position of its
+        # father, plus one, plus the sizes of the subtrees of its preceding siblings
+        levels = tree_levels(tree.parents)
+        sizes = subtree_sizes(tree.parents, levels)
+        positions = np.zeros(len(tree.parents), dtype=int)
+        for level in levels[1:]:
+            fathers = tree.parents[level]
+            preceding = np.cumsum(sizes[level]) - sizes[level]
+            first_sibling = np.maximum.accumulate(
+                np.where(np.r_[True, fathers[1:] != fathers[:-1]], np.arange(len(level)), 0))
+            positions[level] = positions[fathers] + 1 + preceding - preceding[first_sibling]
+        order = np.argsort(positions)
+        parents = np.where(tree.parents[order] >= 0, positions[tree.parents[order]], -1)
+        edge_lens = tree.edge_lens[order].astype(float)
+        edge_lens[0] = np.nan
+        names = [''] * len(order)
+        name_gen = NameGenerator()
+        for leaf in positions[tree.leaves].tolist():
+            names[leaf] = name_gen.next()
+        return cls.from_pre_order(parents, edge_lens, names, order)
+
+    @classmethod
+    def from_newick(cls, data: str, synthetic_names: bool = False) -> 'FlatTree':
+        from .phylip.newick import parse_flat_newick  # The parser builds TreeNodes, so it imports this module
+        return parse_flat_newick(data, synthetic_names)
+
+    def to_tree_view(self) -> TreeView:
+        nodes = [
+            TreeNode(
+                id_, name=name, edge_len=None if edge_len != edge_len else edge_len,
+                bootstrap=None if bootstrap != bootstrap else bootstrap)
+            for id_, name, edge_len, bootstrap in zip(
+                self.ids.tolist(), self.names, self.edge_lens.tolist(), self.bootstraps.tolist())]
+        for node, father in zip(nodes[1:], self.parents[1:].tolist()):
+            node.father = nodes[father]
+            nodes[father].children.append(node)
+        return TreeView(nodes[0], [nodes[idx] for idx in self.leaves.tolist()])
+
+    def to_newick(self, precision: Optional[int] = None) -> str:
+        # Same output as TreeNode.to_newick, pending items are either node indexes or text closing a subtree
+        edge_lens = self.edge_lens.tolist()
+        bootstraps = self.bootstraps.tolist()
+        child_offsets = self.child_offsets.tolist()
+        children = self.children.tolist()
+
+        def _node_suffix(idx: int) -> str:
+            suffix = self.names[idx]
+            edge_len = edge_lens[idx]
+            if edge_len and edge_len == edge_len:
+                suffix += f":{edge_len}" if precision is None else f":{edge_len:.{precision}f}"
+            if bootstraps[idx] and bootstraps[idx] == bootstraps[idx]:
+                suffix += f":{bootstraps[idx]}"
+            return suffix
+
+        res = io.StringIO()
+        to_write: List[Union[int, str]] = [0]
+        while to_write:
+            item = to_write.pop()
+            if isinstance(item, str):
+                res.write(item)
+            elif child_offsets[item] < child_offsets[item + 1]:
+                res.write('(')
+                to_write.append(')' + _node_suffix(item))
+                node_children = children[child_offsets[item]:child_offsets[item + 1]]
+                for idx, child in enumerate(reversed(node_children)):
+                    if idx:
+                        to_write.append(',')
+                    to_write.append(child)
+            else:
+                res.write(_node_suffix(item))
+        res.write(';')
+        return res.getvalue()
+
+    @property
+    def leaves(self) -> np.ndarray:
+        return np.flatnonzero(self.subtree_sizes == 1)
+
+    def depths(self) -> np.ndarray:
+        depths = np.zeros(len(self.parents))
+        edge_lens = np.nan_to_num(self.edge_lens)
+        for level in tree_levels(self.parents)[1:]:
+            depths[level] = depths[self.parents[level]] + edge_lens[level]
+        return depths
+
+    def branch_len_stats(self) -> BranchLenStats:
+        lengths = np.nan_to_num(self.edge_lens[1:])  # Newick writers omit lengths of 0
+        return BranchLenStats(float(lengths.mean()), float(np.median(lengths)), len(lengths))
+
+    def clade_masks(self, nodes: Optional[np.ndarray] = None) -> np.ndarray:
+        # Row i marks the leaves (in pre-order) under nodes[i], the internal nodes by default
+        if nodes is None:
+            nodes = np.flatnonzero(self.subtree_sizes > 1)
+        nodes = np.asarray(nodes)
+        leaves = self.leaves
+        return (leaves >= nodes[:, None]) & (leaves < (nodes + self.subtree_sizes[nodes])[:, None])
+
+
+class ArrayYuleTreeGenerator:
+    # Builds the same kind of trees as YuleTreeGenerator in O(1) per step: the leaves are kept in an array (a split
+    # leaf is replaced by its first child), all the random values are drawn upfront and the tree is built as parent
+    # and edge length arrays, which are only turned into TreeNodes on demand.
+    def __init__(self, size: int, scale: float, seed: int):
+        if scale <= 0:
+            raise ValueError("scale must be a positive number")
+        self._rndm_gen = default_rng(seed)
+        self._size = size
+        self._scale = scale
+
+    def generate(self, ultrametric: bool = False, ultrametric_mode: str = ULTRAMETRIC_HANG) -> ParentArrayTree:
+        assert ultrametric_mode in ULTRAMETRIC_MODES
+        hang = ultrametric and ultrametric_mode == ULTRAMETRIC_HANG
+        steps = self._size - 1
+        node_count = 2 * steps + 1
+        picks = self._rndm_gen.random(steps).tolist()
+        new_edges = self._rndm_gen.exponential(scale=self._scale, size=2 * steps).tolist()
+        hang_points = self._rndm_gen.random(steps).tolist()
+        parents = [-1] * node_count
+        edge_lens = [0.0] * node_count
+        leaves = [0] * self._size
+        next_id = 1
+        for step in range(steps):
+            slot = int(picks[step] * (step + 1))
+            leaf = leaves[slot]
+            first, second = next_id, next_id + 1
+            if hang and leaf != 0:  # Hang a new father (first) above the leaf, with a new sibling (second)
+                hang_at = hang_points[step] * edge_lens[leaf]
+                edge_lens[leaf] -= hang_at
+                parents[first], edge_lens[first] = parents[leaf], hang_at
+                parents[leaf] = first
+                parents[second], edge_lens[second] = first, new_edges[2 * step]
+            else:
+                parents[first], edge_lens[first] = leaf, new_edges[2 * step]
+                parents[second], edge_lens[second] = leaf, new_edges[2 * step + 1]
+                leaves[slot] = first
+            leaves[step + 1] = second
+            next_id += 2
+        tree = ParentArrayTree(np.array(parents), np.array(edge_lens), np.array(leaves))
+        if ultrametric and ultrametric_mode == ULTRAMETRIC_EXTEND:
+            tree = tree.extend_to_ultrametric()
+        return tree
+
+    def construct(self, ultrametric: bool = False, ultrametric_mode: str = ULTRAMETRIC_HANG) -> TreeView:
+        return self.generate(ultrametric, ultrametric_mode).to_tree_view()
+
+
+TREE_GENERATORS = {
+    "list": YuleTreeGenerator,
+    "array": ArrayYuleTreeGenerator,
+}
 
 
 def fill_genome(
@@ -201,6 +526,189 @@ def fill_genome(
         fill_genome(child, genome_size=genome_size, maker=maker, total_jumped=total_jumped)
 
 
+def fill_genome_by_level(
+        root: TreeNode, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker):
+    assert total_jumped is not None
+    assert root.father is None
+    root.genome = make_identity_genome(genome_size)
+    level = [root]
+    genomes = np.array([root.genome.genes])
+    while level:
+        edges = [(row, child) for row, node in enumerate(level) for child in node.children]
+        if not edges:
+            break
+        parent_rows = np.array([row for row, _ in edges])
+        scales = np.array([child.edge_len for _, child in edges])
+        jumped, genomes = maker.make_batch(genomes[parent_rows], scales)
+        level = [child for _, child in edges]
+        for child, genes in zip(level, genomes):
+            child.genome = Genome(genes.tolist())
+        total_jumped.extend(jumped.tolist())
+
+
+def iter_leaf_genomes(
+        root: TreeNode, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker) -> Iterator[TreeNode]:
+    # Same traversal order as fill_genome, but an internal node's genome is released as soon as its last child is
+    # derived, so at most one genome per tree level is alive on top of the leaves that were already yielded.
+    assert total_jumped is not None
+    assert root.father is None
+    root.genome = make_identity_genome(genome_size)
+    to_visit = list(reversed(root.children))
+    if not to_visit:
+        yield root
+        return
+    while to_visit:
+        node = to_visit.pop()
+        father = node.father
+        jumped, node.genome = maker.make(father.genome, scale=node.edge_len)
+        total_jumped.append(jumped)
+        if node is father.children[-1]:
+            father.genome = None
+        if node.children:
+            to_visit.extend(reversed(node.children))
+        else:
+            yield node
+
+
+def fill_leaf_genomes(
+        root: TreeNode, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker):
+    for _ in iter_leaf_genomes(root, genome_size=genome_size, total_jumped=total_jumped, maker=maker):
+        pass
+
+
+# Edges of a subtree in pre-order: (node id, index of the father edge or -1 for the subtree root, edge length)
+SubtreeEdges = List[Tuple[int, int, float]]
+SUBTREES_PER_PROCESS = 4
+
+
+def _flatten_subtree(subtree_root: TreeNode) -> Tuple[List[TreeNode], SubtreeEdges]:
+    nodes = []
+    edges = []
+    to_visit = [(child, -1) for child in reversed(subtree_root.children)]
+    while to_visit:
+        node, father_idx = to_visit.pop()
+        nodes.append(node)
+        edges.append((node.id, father_idx, node.edge_len))
+        to_visit.extend((child, len(edges) - 1) for child in reversed(node.children))
+    return nodes, edges
+
+
+def evolve_subtree(
+        genes: List[int], edges: SubtreeEdges, seed: int, alpha: float) -> Tuple[Dict[int, List[int]], List[int]]:
+    maker = GenomeMaker(seed, alpha)
+    subtree_root = Genome(genes)
+    genomes: List[Optional[Genome]] = []
+    remaining_children = [0] * len(edges)
+    for _, father_idx, _ in edges:
+        if father_idx >= 0:
+            remaining_children[father_idx] += 1
+    leaves = {}
+    total_jumped = []
+    for idx, (node_id, father_idx, edge_len) in enumerate(edges):
+        father = subtree_root if father_idx < 0 else genomes[father_idx]
+        jumped, genome = maker.spawn(node_id).make(father, scale=edge_len)
+        total_jumped.append(jumped)
+        if father_idx >= 0:
+            remaining_children[father_idx] -= 1
+            if remaining_children[father_idx] == 0:
+                genomes[father_idx] = None
+        if remaining_children[idx] == 0:
+            leaves[node_id] = genome.genes
+            genome = None
+        genomes.append(genome)
+    return leaves, total_jumped
+
+
+def fill_genome_by_subtrees(
+        root: TreeNode, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker, processes: int = 1):
+    # Every edge draws from its own stream spawned from the maker's seed and the child's id, so the subtrees can be
+    # evolved in any order and by any number of processes while yielding the same leaves.
+    # Only the leaves keep their genomes.
+    assert total_jumped is not None
+    assert root.father is None
+    assert processes > 0
+    root.genome = make_identity_genome(genome_size)
+    frontier = [root]
+    while len(frontier) < processes * SUBTREES_PER_PROCESS and any(node.children for node in frontier):
+        next_frontier = []
+        for node in frontier:
+            for child in node.children:
+                jumped, child.genome = maker.spawn(child.id).make(node.genome, scale=child.edge_len)
+                total_jumped.append(jumped)
+                next_frontier.append(child)
+            if node.children:
+                node.genome = None
+            else:
+                next_frontier.append(node)
+        frontier = next_frontier
+    subtrees = [node for node in frontier if node.children]
+    flattened = [_flatten_subtree(node) for node in subtrees]
+    jobs = [(node.genome.genes, edges, maker.seed, maker.alpha) for node, (_, edges) in zip(subtrees, flattened)]
+    logging.debug("Evolving %s subtrees using %s processes", len(jobs), processes)
+    if processes == 1 or not jobs:
+        results = list(itertools.starmap(evolve_subtree, jobs))
+    else:
+        with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(evolve_subtree, *zip(*jobs)))
+    for subtree_root, (nodes, _), (leaves, jumped) in zip(subtrees, flattened, results):
+        subtree_root.genome = None
+        for node in nodes:
+            node.genome = Genome(leaves[node.id]) if node.id in leaves else None
+        total_jumped.extend(jumped)
+
+
+def fill_flat_genomes(
+        tree: FlatTree, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker) -> np.ndarray:
+    # Same draws as fill_genome_by_level, but only the genomes of one level of internal nodes are kept on top of the
+    # leaves. Returns the genomes of the leaves, one row each in pre-order.
+    assert total_jumped is not None
+    leaves = tree.leaves
+    leaf_rows = np.full(len(tree.parents), -1)
+    leaf_rows[leaves] = np.arange(len(leaves))
+    leaf_genomes = np.empty((len(leaves), genome_size), dtype=np.int64)
+    genomes = np.arange(1, genome_size + 1)[None, :]
+    if len(leaves) == 1:
+        leaf_genomes[0] = genomes[0]
+    rows = np.zeros(len(tree.parents), dtype=int)  # The row of every node's genome in its level
+    for level in tree_levels(tree.parents)[1:]:
+        jumped, genomes = maker.make_batch(genomes[rows[tree.parents[level]]], tree.edge_lens[level])
+        total_jumped.extend(jumped.tolist())
+        is_leaf = tree.subtree_sizes[level] == 1
+        leaf_genomes[leaf_rows[level[is_leaf]]] = genomes[is_leaf]
+        genomes = genomes[~is_leaf]
+        rows[level[~is_leaf]] = np.arange(len(genomes))
+    return leaf_genomes
+
+
+def fill_flat_tree_genomes(
+        root: TreeNode, genome_size: int, total_jumped: Optional[List[int]], maker: GenomeMaker):
+    # fill_flat_genomes over the flattened tree, same leaves as fill_genome_by_level. Only the leaves keep their
+    # genomes.
+    assert root.father is None
+    leaf_genomes = fill_flat_genomes(
+        FlatTree.from_tree_node(root), genome_size=genome_size, total_jumped=total_jumped, maker=maker)
+    leaves = []
+    to_visit = [root]
+    while to_visit:  # Pre-order, as the rows of leaf_genomes
+        node = to_visit.pop()
+        node.genome = None
+        if node.children:
+            to_visit.extend(reversed(node.children))
+        else:
+            leaves.append(node)
+    for leaf, genes in zip(leaves, leaf_genomes):
+        leaf.genome = Genome(genes.tolist())
+
+
+FILL_MODES = {
+    "recursive": fill_genome,
+    "level": fill_genome_by_level,
+    "streaming": fill_leaf_genomes,
+    "subtrees": fill_genome_by_subtrees,
+    "flat": fill_flat_tree_genomes,
+}
+
+
 class TreeDesc(NamedTuple):
     newick: str
     internal_edges: int
@@ -0,0 +1,63 @@
+import logging
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from .name_gen import NameGenerator
+from .tree import FlatTree, TreeView, TREE_GENERATORS, ULTRAMETRIC_HANG
+
+
+class TreeLibrary:
+    # Yule trees stored on disk by the parameters which determine them, so runs sweeping other parameters (alpha,
+    # genome size) over the same seeds reuse identical trees instead of building them again. Every tree is kept as
+    # its pre-order parent and edge length arrays, the node ids and the order in which its leaves are named.
+    def __init__(self, path: Path):
+        self._path = path
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    def tree_path(
+            self, leaf_count: int, scale: float, ultrametric: bool, seed: int, tree_generator: str = "list",
+            ultrametric_mode: str = ULTRAMETRIC_HANG) -> Path:
+        mode = ultrametric_mode if ultrametric else "none"
+        return self._path / f"{tree_generator}_leaves_{leaf_count}_scale_{scale}_ultrametric_{mode}_seed_{seed}.npz"
+
+    def get(
+            self, leaf_count: int, scale: float, ultrametric: bool, seed: int, tree_generator: str = "list",
+            ultrametric_mode: str = ULTRAMETRIC_HANG) -> TreeView:
+        # Same tree as TREE_GENERATORS[tree_generator](leaf_count, scale, seed).construct(...), built on first use
+        path = self.tree_path(leaf_count, scale, ultrametric, seed, tree_generator, ultrametric_mode)
+        if path.is_file():
+            logging.debug("Loading tree from: %s", path)
+            return self._load(path)
+        tree = TREE_GENERATORS[tree_generator](size=leaf_count, scale=scale, seed=seed).construct(
+            ultrametric, ultrametric_mode)
+        self._save(path, tree)
+        return tree
+
+    @staticmethod
+    def _save(path: Path, tree: TreeView):
+        flat = FlatTree.from_tree_node(tree.root)
+        leaf_rows = {node_id: idx for idx, node_id in enumerate(flat.ids.tolist())}
+        tmp_path = path.with_name(f".{uuid.uuid4()}_{path.name}")
+        with tmp_path.open("wb") as f:
+            np.savez_compressed(
+                f, parents=flat.parents.astype(np.int32), edge_lens=flat.edge_lens, ids=flat.ids.astype(np.int32),
+                leaf_order=np.array([leaf_rows[leaf.id] for leaf in tree.leaves], dtype=np.int32))
+        os.replace(tmp_path, path)  # Concurrent runs either find the whole tree or none of it
+
+    @staticmethod
+    def _load(path: Path) -> TreeView:
+        with np.load(path) as data:
+            parents, edge_lens, ids, leaf_order = (
+                data[key].astype(int) if key != "edge_lens" else data[key]
+                for key in ("parents", "edge_lens", "ids", "leaf_order"))
+        names = [''] * len(parents)
+        name_gen = NameGenerator()
+        for leaf in leaf_order.tolist():
+            names[leaf] = name_gen.next()
+        flat = FlatTree.from_pre_order(parents, edge_lens, names, ids)
+        view = flat.to_tree_view()
+        leaves = [view.leaves[idx] for idx in np.searchsorted(flat.leaves, leaf_order).tolist()]
+        return TreeView(view.root, leaves)